@@ -0,0 +1,145 @@
+"""Portfolio analytics over a user's balance history.
+
+The joined updates/accounts frame is pivoted once into a dense
+(account x month) matrix, each balance carried forward until the account's
+next update, and every metric is computed for all values of a dimension at
+once with array operations.
+
+StackSight records balances, not cash flows, so the contribution-adjusted
+figures treat an account's first balance as money contributed that month:
+growth is measured net of accounts being opened.
+"""
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+from streamlit import cache_resource
+
+from cache_utils import memoize
+from dataset_utils import CATEGORY_COLUMNS, get_user_dataset
+from db_utils import data_version
+from metrics_utils import cache_request, cache_miss
+
+
+# latest-month figures per dimension value, shown on the Tables page
+SUMMARY_COLUMNS = ["Balance", "MoM Change", "MoM %", "Growth", "CAGR", "Drawdown", "Max Drawdown", "Share"]
+PERCENT_COLUMNS = ["MoM %", "Growth", "CAGR", "Drawdown", "Max Drawdown", "Share"]
+# per-month series the Charts page can plot
+SERIES_METRICS = ["Month-over-month change", "Growth index", "Drawdown", "Share of total"]
+TOTAL = "Total"
+
+# accounts: one row per matrix row, with its dimension values; months: month starts
+BalanceMatrix = namedtuple("BalanceMatrix", ["accounts", "months", "balances", "contributions"])
+Analytics = namedtuple("Analytics", ["summary", "series"])
+
+
+def build_matrix(df):
+    """Pivot a get_user_dataset frame into forward-filled (account x month) balances and contributions."""
+    if df.empty:
+        return BalanceMatrix(pd.DataFrame(columns=CATEGORY_COLUMNS), pd.DatetimeIndex([]),
+                             np.zeros((0, 0)), np.zeros((0, 0)))
+    account_num = df["account_num"].cat.remove_unused_categories()
+    month = (df["begda"].dt.year * 12 + df["begda"].dt.month).to_numpy()
+    first_month = month.min()
+    position = month - first_month
+    n_months = position.max() + 1
+
+    # the last update of each account and month wins
+    latest = pd.DataFrame({"account": account_num.cat.codes.to_numpy(), "position": position,
+                           "begda": df["begda"].to_numpy(), "money": df["money"].to_numpy(dtype=float)})
+    latest = latest.sort_values("begda", kind="stable").drop_duplicates(["account", "position"], keep="last")
+
+    accounts = account_num.cat.categories
+    dense = np.full((len(accounts), n_months), np.nan)
+    dense[latest["account"].to_numpy(), latest["position"].to_numpy()] = latest["money"].to_numpy()
+
+    # carry each balance forward: index of the last observed month, -1 before the first
+    observed = ~np.isnan(dense)
+    last_seen = np.where(observed, np.arange(n_months), -1)
+    np.maximum.accumulate(last_seen, axis=1, out=last_seen)
+    rows = np.arange(len(accounts))[:, None]
+    balances = np.where(last_seen >= 0, dense[rows, np.maximum(last_seen, 0)], 0.0)
+
+    opened = observed.argmax(axis=1)
+    contributions = np.zeros_like(balances)
+    contributions[rows[:, 0], opened] = balances[rows[:, 0], opened]
+
+    attributes = (df.drop_duplicates("account_num")
+                  .set_index("account_num")[[column for column in CATEGORY_COLUMNS if column != "account_num"]]
+                  .reindex(accounts))
+    attributes.insert(0, "account_num", accounts)
+    months = pd.date_range(pd.Timestamp(year=(first_month - 1) // 12, month=(first_month - 1) % 12 + 1, day=1),
+                           periods=n_months, freq="MS")
+    return BalanceMatrix(attributes.reset_index(drop=True), months, balances, contributions)
+
+
+def _group_sums(codes, n_groups, rows):
+    """Rows summed per group code, plus a last TOTAL row summing every row; O(rows x months)."""
+    sums = np.zeros((n_groups, rows.shape[1]))
+    np.add.at(sums, codes.ravel(), rows)
+    sums[-1] = rows.sum(axis=0)
+    return sums
+
+
+def portfolio_metrics(matrix, dimension, label):
+    """Summary and per-month series for every value of a dimension, plus the whole portfolio as TOTAL."""
+    if not len(matrix.months):
+        return Analytics(pd.DataFrame(columns=[label] + SUMMARY_COLUMNS),
+                         pd.DataFrame(columns=[label, "Date"] + SERIES_METRICS))
+    values, codes = np.unique(matrix.accounts[dimension].astype(str).to_numpy(), return_inverse=True)
+    n_groups, n_months = len(values) + 1, len(matrix.months)
+    names = list(values) + [TOTAL]
+
+    balances = _group_sums(codes, n_groups, matrix.balances)
+    contributions = _group_sums(codes, n_groups, matrix.contributions)
+    # previous month's balance, NaN for the first month
+    previous = np.concatenate([np.full((n_groups, 1), np.nan), balances[:, :-1]], axis=1)
+    change = balances - previous
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mom_pct = np.where(previous > 0, change / previous, np.nan)
+        returns = np.where(previous > 0, (change - contributions) / previous, 0.0)
+        share = np.where(balances[-1] > 0, balances / balances[-1], np.nan)
+    growth = np.cumprod(1 + returns, axis=1)
+    drawdown = growth / np.maximum.accumulate(growth, axis=1) - 1
+
+    # CAGR of the growth index over the months since each group's first balance
+    active = balances > 0
+    elapsed = n_months - 1 - np.where(active.any(axis=1), active.argmax(axis=1), n_months - 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cagr = np.where(elapsed > 0, growth[:, -1] ** (12 / np.maximum(elapsed, 1)) - 1, np.nan)
+
+    summary = pd.DataFrame({label: names,
+                            "Balance": balances[:, -1],
+                            "MoM Change": change[:, -1],
+                            "MoM %": mom_pct[:, -1],
+                            "Growth": growth[:, -1] - 1,
+                            "CAGR": cagr,
+                            "Drawdown": drawdown[:, -1],
+                            "Max Drawdown": drawdown.min(axis=1),
+                            "Share": share[:, -1]})
+    series = pd.DataFrame({label: np.repeat(names, n_months),
+                           "Date": np.tile(matrix.months, n_groups),
+                           "Month-over-month change": change.ravel(),
+                           "Growth index": growth.ravel(),
+                           "Drawdown": drawdown.ravel(),
+                           "Share of total": share.ravel()})
+    return Analytics(summary, series)
+
+
+@cache_resource(max_entries=64, show_spinner=False)
+def _load_matrix(username, version):
+    # version only takes part in the cache key, as in dataset_utils
+    cache_miss("balance_matrix")
+    return build_matrix(get_user_dataset(username))
+
+
+@memoize("analytics")
+def _analytics(username, version, dimension, label):
+    cache_miss("analytics")
+    return portfolio_metrics(_load_matrix(username, version), dimension, label)
+
+
+def portfolio_analytics(username, dimension, label):
+    """(summary, series) frames for one of the FILTER_DICT dimensions, recomputed only after writes."""
+    cache_request("analytics")
+    return _analytics(username, data_version(username), dimension, label)
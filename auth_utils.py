@@ -0,0 +1,206 @@
+import base64
+import hashlib
+import hmac
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from streamlit import secrets
+
+# db_utils (SQLAlchemy, pandas, bcrypt) is imported on first login or token check, so
+# Home and Login for a visitor without a session token do not pay for it
+
+
+# bcrypt hash of a random string, used so unknown usernames cost the same as known ones
+_DUMMY_HASH = "$2b$12$C6UzMDM.H6dfI/f/IKcEeO5rFrOS5yPZ3x6ZMz6Ys3P1zT0XlS0i6"
+
+MAX_TRACKED_KEYS = 10000  # rate-limit keys kept in memory; beyond this, attempts are refused until some expire
+
+PASSWORD_HASH_QUERY = "SELECT pword FROM users WHERE uname = :username"
+TOKEN_STATE_QUERY = "SELECT pword, token_generation FROM users WHERE uname = :username"
+REVOKE_TOKENS_QUERY = "UPDATE users SET token_generation = token_generation + 1 WHERE uname = :username"
+
+_SIGNATURE = re.compile(r"[0-9a-f]{64}")  # hex HMAC-SHA256, as _sign writes it
+
+_executor = None
+_executor_lock = threading.Lock()
+_inflight = None
+_attempts = {}
+_attempts_lock = threading.Lock()
+
+
+class LoginThrottled(Exception):
+    """Raised when a login attempt is rejected before running bcrypt."""
+
+
+def _setting(name, default):
+    return secrets.get("auth", {}).get(name, default)
+
+
+def _get_executor():
+    """Bounded bcrypt worker pool, shared by every session of this process."""
+    global _executor, _inflight
+    with _executor_lock:
+        if _executor is None:
+            workers = int(_setting("bcrypt_workers", 2))
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+            # running + queued verifications; anything above this is refused outright
+            _inflight = threading.BoundedSemaphore(int(_setting("max_pending_logins", workers * 4)))
+    return _executor
+
+
+def client_address(headers, peer):
+    """Address to rate-limit a login by, or None if it is unknown.
+
+    peer (st.context.ip_address) is the TCP peer: None for localhost or a
+    proxy on the same host, and the proxy's own address behind a load
+    balancer, which would put every visitor in one bucket. Behind a proxy,
+    set [auth] client_ip_header (e.g. "X-Forwarded-For") to the header it
+    writes, and [auth] proxy_hops to the number of proxies that append to
+    it; the entry they appended is used, since earlier ones are whatever
+    the client sent.
+    """
+    header = _setting("client_ip_header", None)
+    if not header:
+        return peer
+    entries = [entry.strip() for value in headers.get_all(header) for entry in value.split(",")]
+    hops = int(_setting("proxy_hops", 1))
+    if len(entries) < hops:  # the request did not come through the proxies
+        return None
+    return entries[-hops] or None
+
+
+def _allow_attempt(username, client=None):
+    """Sliding-window limits of login attempts per client and username, per client, and for the whole process.
+
+    Keying the username limit by client means guessing from one address
+    cannot lock the real user out from another. Without a client address
+    only the process-wide limit applies, since one shared bucket would let
+    a single visitor lock out everyone; the bcrypt semaphore still bounds
+    the work.
+    """
+    window = float(_setting("attempt_window_seconds", 60))
+    limits = [(("all",), int(_setting("global_attempts_per_window", 200)))]
+    if client is not None:
+        limits += [(("user", client, username), int(_setting("attempts_per_window", 5))),
+                   (("client", client), int(_setting("client_attempts_per_window", 20)))]
+    now = time.monotonic()
+    with _attempts_lock:
+        if len(_attempts) + len(limits) > MAX_TRACKED_KEYS:
+            for key in [key for key, attempts in _attempts.items() if not attempts or now - attempts[-1] > window]:
+                del _attempts[key]
+            if len(_attempts) + len(limits) > MAX_TRACKED_KEYS:
+                return False
+        windows = []
+        for key, limit in limits:
+            attempts = _attempts.get(key, deque())
+            while attempts and now - attempts[0] > window:
+                attempts.popleft()
+            if len(attempts) >= limit:
+                return False
+            windows.append((key, attempts))
+        for key, attempts in windows:
+            attempts.append(now)
+            _attempts[key] = attempts
+        return True
+
+
+def get_password_hash(username):
+    """Fetch the stored hash for a single user (primary key lookup)."""
+    from db_utils import return_run_query
+
+    rows = return_run_query(query_str=PASSWORD_HASH_QUERY, params={"username": username})
+    return rows[0][0] if rows else None
+
+
+def get_token_state(username):
+    """(password hash, token generation) of a user, or None if there is no such user."""
+    from db_utils import return_run_query
+
+    rows = return_run_query(query_str=TOKEN_STATE_QUERY, params={"username": username})
+    return tuple(rows[0]) if rows else None
+
+
+def revoke_tokens(username):
+    """Invalidate every session token issued to a user so far, on every device and replica."""
+    from db_utils import run_query
+
+    run_query(query_str=REVOKE_TOKENS_QUERY, params={"username": username})
+
+
+def authenticate(username, password, client=None):
+    """Check a username/password pair, running bcrypt on the worker pool.
+
+    client identifies the caller for rate limiting (see client_address), or is
+    None when unknown.
+    Raises LoginThrottled when there are too many recent attempts or the
+    pool is already saturated.
+    """
+    if not _allow_attempt(username, client):
+        raise LoginThrottled("Too many login attempts. Please wait a minute and try again.")
+
+    from db_utils import check_password
+
+    executor = _get_executor()
+    if not _inflight.acquire(blocking=False):
+        raise LoginThrottled("The server is busy. Please try again in a moment.")
+    try:
+        hashed = get_password_hash(username)
+        future = executor.submit(check_password, password, hashed or _DUMMY_HASH)
+        return future.result() and hashed is not None
+    finally:
+        _inflight.release()
+
+
+def _token_key():
+    key = _setting("token_key", None)
+    return key.encode("utf-8") if key else None
+
+
+def _sign(key, payload, state):
+    # the stored hash and token generation are signed but not sent, so changing
+    # the password or logging out (revoke_tokens) invalidates every token
+    password_hash, generation = state
+    message = f"{payload}:{password_hash}:{generation}".encode("utf-8")
+    return hmac.new(key, message, hashlib.sha256).hexdigest()
+
+
+def issue_token(username):
+    """Create a signed session token so returning visits can skip bcrypt.
+
+    Returns None unless [auth] token_key is set: a per-process key would stop
+    working after a restart and on every other replica. The token travels in
+    the URL, so it ends up in browser history and copied links; it is valid
+    until it expires ([auth] token_ttl_seconds) or the user logs out.
+    """
+    key = _token_key()
+    state = get_token_state(username) if key else None
+    if state is None:
+        return None
+    expires = int(time.time()) + int(_setting("token_ttl_seconds", 12 * 3600))
+    payload = f"{username}:{expires}"
+    token = f"{payload}:{_sign(key, payload, state)}"
+    return base64.urlsafe_b64encode(token.encode("utf-8")).decode("ascii")
+
+
+def verify_token(token):
+    """Return the username a token was issued for, or None if it is invalid, expired or revoked."""
+    key = _token_key()
+    if not token or key is None:
+        return None
+    try:
+        decoded = base64.urlsafe_b64decode(token.encode("ascii")).decode("utf-8")
+        payload, signature = decoded.rsplit(":", 1)
+        username, expires = payload.rsplit(":", 1)
+        expires = int(expires)
+    except (ValueError, TypeError, UnicodeError):
+        return None
+    # malformed or expired tokens are rejected before the database lookup
+    if not _SIGNATURE.fullmatch(signature) or expires < time.time():
+        return None
+    state = get_token_state(username)
+    if state is None or not hmac.compare_digest(signature.encode("ascii"), _sign(key, payload, state).encode("ascii")):
+        return None
+    return username
@@ -0,0 +1,5 @@
+"""Synthetic data and latency benchmarks for StackSight's page queries.
+
+    python -m benchmarks.harness run postgresql+psycopg2://postgres@localhost/stacksight_bench --replace
+    python -m benchmarks.harness compare baseline.json latest.json
+"""
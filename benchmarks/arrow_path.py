@@ -0,0 +1,123 @@
+"""Decode time and peak memory of the All Data query: read_query_df's path vs copy_to_arrow.
+
+Both paths are timed up to the Arrow IPC bytes Streamlit sends to the
+browser, so the pandas path pays for its second conversion. Memory is
+measured in a fresh process per path and row count: peak RSS growth,
+Python allocations (tracemalloc) and Arrow's memory pool.
+
+    python -m benchmarks.arrow_path postgresql+psycopg2://postgres@localhost/stacksight_bench --size 1x2000x120
+"""
+import argparse
+import multiprocessing
+import resource
+import statistics
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+import pyarrow as pa
+from sqlalchemy import create_engine, text
+from streamlit import dataframe_util
+
+import migrations
+from benchmarks import synthetic
+from benchmarks.harness import parse_size
+from db_utils import copy_to_arrow, prepare_query
+from paging_utils import DIMENSION_COLUMNS, page_query
+
+
+USER = "user_1"
+NO_LIMIT = 2 ** 31 - 1
+
+
+def read_df(conn, params):
+    query, params = prepare_query(page_query(), params)
+    return pd.read_sql_query(query, conn, params=params)
+
+
+def read_arrow(conn, params):
+    return copy_to_arrow(conn, page_query(), params, DIMENSION_COLUMNS)
+
+
+def to_arrow_bytes(result):
+    """What st.dataframe does with the result before sending it."""
+    if isinstance(result, pd.DataFrame):
+        return dataframe_util.convert_pandas_df_to_arrow_bytes(result)
+    return dataframe_util.convert_arrow_table_to_arrow_bytes(result)
+
+
+PATHS = {"read_query_df": read_df, "read_query_arrow": read_arrow}
+
+
+def _params(conn, limit):
+    accounts = [row[0] for row in conn.execute(text("SELECT account_num FROM accounts WHERE uname = :u"), {"u": USER})]
+    return {"username": USER, "accounts": accounts, "limit": limit or NO_LIMIT}
+
+
+def time_path(engine, path, limit, repeat):
+    """Row count and median seconds to decode, and to decode and serialize, over `repeat` runs."""
+    decode, total = [], []
+    with engine.connect() as conn:
+        params = _params(conn, limit)
+        to_arrow_bytes(PATHS[path](conn, params))  # warm-up: compiled statements, described columns
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = PATHS[path](conn, params)
+            decoded = time.perf_counter()
+            to_arrow_bytes(result)
+            decode.append(decoded - start)
+            total.append(time.perf_counter() - start)
+            conn.rollback()
+    return len(result), statistics.median(decode), statistics.median(total)
+
+
+def _measure_memory(url, path, limit):
+    engine = create_engine(url)
+    with engine.connect() as conn:
+        params = _params(conn, limit)
+        to_arrow_bytes(PATHS[path](conn, {**params, "limit": 1}))  # imports and first-use allocations outside the measurement
+        baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        pool_baseline = pa.default_memory_pool().max_memory()
+        tracemalloc.start()
+        to_arrow_bytes(PATHS[path](conn, params))
+        python_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return {"rss_growth_bytes": (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline) * 1024,
+                "python_peak_bytes": python_peak,
+                "arrow_pool_peak_bytes": max(pa.default_memory_pool().max_memory() - pool_baseline, 0)}
+
+
+def measure_memory(url, path, limit):
+    """Peak memory of one run, in a fresh process so earlier runs do not hide it."""
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        return pool.apply(_measure_memory, (url, path, limit))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the pandas and Arrow result paths on the All Data query.")
+    parser.add_argument("url", help="SQLAlchemy URL of a scratch PostgreSQL database")
+    parser.add_argument("--size", default="1x2000x120", help="users x accounts-per-user x months")
+    parser.add_argument("--limits", nargs="+", type=int, default=[50, 250, 10000, 0], help="rows per query, 0 for all")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--replace", action="store_true", help="truncate existing data in the database")
+    args = parser.parse_args(argv)
+
+    engine = create_engine(args.url)
+    migrations.migrate(engine)
+    users, accounts, months = parse_size(args.size)
+    synthetic.load(engine, synthetic.generate(users, accounts, months), replace=args.replace)
+
+    print(f"{'path':<17} {'rows':>8} {'decode':>10} {'+serialize':>11} {'rss growth':>11} {'python peak':>12} {'arrow pool':>11}")
+    for limit in args.limits:
+        for path in PATHS:
+            rows, decode, total = time_path(engine, path, limit, args.repeat)
+            memory = measure_memory(args.url, path, limit)
+            print(f"{path:<17} {rows:>8,} {decode * 1000:>8.1f}ms {total * 1000:>9.1f}ms "
+                  f"{memory['rss_growth_bytes'] / 2**20:>8.1f}MiB {memory['python_peak_bytes'] / 2**20:>9.1f}MiB "
+                  f"{memory['arrow_pool_peak_bytes'] / 2**20:>8.1f}MiB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,55 @@
+"""Peak Python heap of the history export, which should stay flat as the history grows.
+
+Each format and chunk size runs in a fresh process with tracemalloc, so
+the measurement neither slows nor disturbs a live server. Run it from the
+app directory so .streamlit/secrets.toml points at a database with data
+for --user:
+
+    python -m benchmarks.export_memory --user user_1 --chunk-sizes 1000 10000
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tracemalloc
+
+from export_utils import EXPORT_FORMATS, export_history
+
+
+def _measure(user, export_format, chunk_size):
+    from dataset_utils import ACCOUNTS_QUERY
+    from db_utils import return_run_query
+
+    accounts = [row[0] for row in return_run_query(ACCOUNTS_QUERY, {"username": user})]
+    with open(os.devnull, "wb") as sink:
+        export_history(user, accounts, export_format, sink, chunk_size)  # imports and first-use allocations
+        tracemalloc.start()
+        result = export_history(user, accounts, export_format, sink, chunk_size)
+        result["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result
+
+
+def measure(user, export_format, chunk_size):
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        return pool.apply(_measure, (user, export_format, chunk_size))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the peak Python heap of history exports.")
+    parser.add_argument("--user", default="user_1")
+    parser.add_argument("--formats", nargs="+", choices=list(EXPORT_FORMATS), default=list(EXPORT_FORMATS))
+    parser.add_argument("--chunk-sizes", nargs="+", type=int, default=[10000])
+    args = parser.parse_args(argv)
+
+    print(f"{'format':<8} {'chunk':>7} {'rows':>9} {'seconds':>8} {'peak heap':>10}")
+    for export_format in args.formats:
+        for chunk_size in args.chunk_sizes:
+            result = measure(args.user, export_format, chunk_size)
+            print(f"{export_format:<8} {chunk_size:>7,} {result['rows']:>9,} {result['seconds']:>8.2f} "
+                  f"{result['peak_bytes'] / 2**20:>8.1f}MiB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
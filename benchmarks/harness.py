@@ -0,0 +1,210 @@
+"""Latency/memory benchmark of every page query path at several data sizes and concurrency levels.
+
+Each size is generated with benchmarks.synthetic and loaded into the given
+(scratch) database, then every operation runs `--iterations` times per
+concurrency level, each call for a random user. Results are written as JSON;
+`compare` diffs two result files and exits non-zero on p95 regressions.
+"""
+import argparse
+import datetime
+import json
+import platform
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text
+
+import migrations
+from auth_utils import PASSWORD_HASH_QUERY
+from benchmarks import synthetic
+from dataset_utils import ACCOUNTS_QUERY, LATEST_ALL_QUERY
+from db_utils import prepare_query
+from paging_utils import page_query
+from rollup_utils import CHART_ALL_QUERY, OPTIONS_QUERY, balance_statements
+
+
+def _rows(conn, query_str, params):
+    return conn.execute(*prepare_query(query_str, params)).fetchall()
+
+
+def _frame(conn, query_str, params):
+    query, params = prepare_query(query_str, params)
+    return pd.read_sql_query(query, conn, params=params)
+
+
+def login(conn, user, accounts, rng):
+    _rows(conn, PASSWORD_HASH_QUERY, {"username": user})
+
+
+# the pages run these pairs concurrently (db_utils.fan_out); here they run back to back on one connection
+def separated(conn, user, accounts, rng):
+    _rows(conn, OPTIONS_QUERY, {"username": user, "dimension": "account_num"})
+    _frame(conn, CHART_ALL_QUERY, {"username": user, "dimension": "account_num"})
+
+
+def combined(conn, user, accounts, rng):
+    _rows(conn, OPTIONS_QUERY, {"username": user, "dimension": "company_t"})
+    df = _frame(conn, CHART_ALL_QUERY, {"username": user, "dimension": "company_t"})
+    df.groupby("month", as_index=False)["money"].sum()
+
+
+def latest_data(conn, user, accounts, rng):
+    _rows(conn, ACCOUNTS_QUERY, {"username": user})
+    _frame(conn, LATEST_ALL_QUERY, {"username": user})
+
+
+def all_data(conn, user, accounts, rng):
+    selected = [row[0] for row in _rows(conn, ACCOUNTS_QUERY, {"username": user})]
+    params = {"username": user, "accounts": selected, "limit": 51}
+    first = _frame(conn, page_query(), params)
+    if len(first):  # and the following page, as a user paging forward would
+        last = first.iloc[min(len(first), 50) - 1]
+        _frame(conn, page_query("after"),
+               {**params, "key_account": last["Account Number"], "key_begda": last["Last Updated"]})
+
+
+def account_upsert(conn, user, accounts, rng):
+    begda = datetime.date(2040, 1, 1) + datetime.timedelta(days=31 * int(rng.integers(0, 12)))
+    statements = balance_statements(accounts[int(rng.integers(0, len(accounts)))], float(rng.integers(0, 10 ** 6)),
+                                    begda.replace(day=1))
+    with conn.begin():
+        for query_str, params in statements:
+            conn.execute(*prepare_query(query_str, params))
+
+
+OPERATIONS = {"login": login, "separated": separated, "combined": combined,
+              "latest_data": latest_data, "all_data": all_data, "account_upsert": account_upsert}
+
+
+def parse_size(size):
+    users, accounts, months = (int(part) for part in size.lower().split("x"))
+    return users, accounts, months
+
+
+def run_level(engine, operation, users, accounts_per_user, concurrency, iterations, seed):
+    """Run one operation `iterations` times across `concurrency` threads; returns latency stats."""
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(worker_id, calls):
+        rng = np.random.default_rng([seed, worker_id])
+        local = []
+        with engine.connect() as conn:
+            for _ in range(calls):
+                user_id = int(rng.integers(1, users + 1))
+                accounts = [f"ACC-{user_id}-{a}" for a in range(1, accounts_per_user + 1)]
+                start = time.perf_counter()
+                operation(conn, f"user_{user_id}", accounts, rng)
+                if conn.in_transaction():
+                    conn.rollback()  # end read transactions so snapshots do not pile up
+                local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    calls = [iterations // concurrency + (i < iterations % concurrency) for i in range(concurrency)]
+    measure_memory = concurrency == 1
+    if measure_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(worker, range(concurrency), calls))
+    wall = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] if measure_memory else None
+    if measure_memory:
+        tracemalloc.stop()
+
+    ms = np.array(latencies) * 1000
+    return {"calls": len(ms), "throughput": len(ms) / wall,
+            "p50_ms": float(np.percentile(ms, 50)), "p95_ms": float(np.percentile(ms, 95)),
+            "p99_ms": float(np.percentile(ms, 99)), "max_ms": float(ms.max()),
+            "peak_python_bytes": peak}
+
+
+def _metadata(engine):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    with engine.connect() as conn:
+        server = conn.execute(text("SHOW server_version")).scalar()
+    return {"timestamp": datetime.datetime.now().isoformat(timespec="seconds"), "commit": commit,
+            "python": platform.python_version(), "postgres": server}
+
+
+def run(args):
+    engine = create_engine(args.url, pool_size=max(args.concurrency), max_overflow=0)
+    migrations.migrate(engine)
+    operations = args.operations or list(OPERATIONS)
+    report = {"meta": _metadata(engine), "results": []}
+
+    for index, size in enumerate(args.sizes):
+        users, accounts_per_user, months = parse_size(size)
+        frames = synthetic.generate(users, accounts_per_user, months, seed=args.seed)
+        start = time.perf_counter()
+        synthetic.load(engine, frames, replace=args.replace or index > 0)  # later sizes replace our own data
+        print(f"[{size}] loaded {len(frames['updates']):,} updates in {time.perf_counter() - start:.1f}s")
+
+        for name in operations:
+            for concurrency in args.concurrency:
+                stats = run_level(engine, OPERATIONS[name], users, accounts_per_user, concurrency, args.iterations, args.seed)
+                report["results"].append({"size": size, "operation": name, "concurrency": concurrency, **stats})
+                print(f"[{size}] {name:<15} c={concurrency:<3} p50={stats['p50_ms']:7.2f}ms "
+                      f"p95={stats['p95_ms']:7.2f}ms {stats['throughput']:8.1f} ops/s")
+
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"Wrote {args.output}")
+    return 0
+
+
+def compare(args):
+    with open(args.baseline) as file:
+        baseline = {(r["size"], r["operation"], r["concurrency"]): r for r in json.load(file)["results"]}
+    with open(args.candidate) as file:
+        candidate = json.load(file)["results"]
+
+    regressions = 0
+    for result in candidate:
+        key = (result["size"], result["operation"], result["concurrency"])
+        if key not in baseline:
+            continue
+        ratio = result["p95_ms"] / baseline[key]["p95_ms"] if baseline[key]["p95_ms"] else 1.0
+        regressed = ratio > args.threshold
+        regressions += regressed
+        print(f"{'REGRESSION' if regressed else 'ok':<10} {key[0]} {key[1]:<15} c={key[2]:<3} "
+              f"p95 {baseline[key]['p95_ms']:.2f}ms -> {result['p95_ms']:.2f}ms ({ratio:.2f}x)")
+    return 1 if regressions else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark StackSight page queries on synthetic data.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="load synthetic data and time every query path")
+    run_parser.add_argument("url", help="SQLAlchemy URL of a scratch PostgreSQL database")
+    run_parser.add_argument("--sizes", nargs="+", default=["100x5x24", "1000x5x60"],
+                            help="users x accounts-per-user x months, e.g. 1000x5x60")
+    run_parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 4, 16])
+    run_parser.add_argument("--iterations", type=int, default=200, help="calls per operation and concurrency level")
+    run_parser.add_argument("--operations", nargs="+", choices=list(OPERATIONS))
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--replace", action="store_true", help="truncate existing data in the database")
+    run_parser.add_argument("--output", default="benchmark_results.json")
+
+    compare_parser = commands.add_parser("compare", help="diff two result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("candidate")
+    compare_parser.add_argument("--threshold", type=float, default=1.25, help="p95 ratio that counts as a regression")
+
+    args = parser.parse_args(argv)
+    return run(args) if args.command == "run" else compare(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
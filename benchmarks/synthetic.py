@@ -0,0 +1,87 @@
+"""Deterministic synthetic data for the StackSight schema.
+
+Users are named user_<n> and own accounts ACC-<n>-<m>. Account openings are
+staggered over the first half of the history, companies follow a Zipf-like
+popularity curve, and balances follow a per-account random walk with drift.
+"""
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from db_utils import copy_frame
+from rollup_utils import REBUILD_STATEMENTS
+
+
+COMPANY_TYPES = ["Bank", "Insurance", "Investment House", "Pension Fund", "Broker", "Credit Union"]
+N_COMPANIES = 60
+N_PLANS = 15
+N_PATHS = 10
+
+_TABLES = ["company_types", "companies", "financial_plans", "paths", "users", "accounts", "updates"]
+_SERIALS = [("company_types", "ctype"), ("companies", "company"), ("financial_plans", "plan"), ("paths", "fin_path")]
+
+
+def generate(users, accounts_per_user, months, seed=0, start="2015-01-01"):
+    """Frames for every table, keyed by table name; the same arguments always give the same data."""
+    rng = np.random.default_rng(seed)
+
+    company_types = pd.DataFrame({"ctype": np.arange(1, len(COMPANY_TYPES) + 1), "ctype_t": COMPANY_TYPES})
+    company_ids = np.arange(1, N_COMPANIES + 1)
+    companies = pd.DataFrame({"company": company_ids,
+                              "company_t": [f"Company {i}" for i in company_ids],
+                              "ctype": rng.integers(1, len(COMPANY_TYPES) + 1, N_COMPANIES),
+                              "company_link": [f"https://example.com/{i}" for i in company_ids]})
+    financial_plans = pd.DataFrame({"plan": np.arange(1, N_PLANS + 1),
+                                    "plan_t": [f"Plan {i}" for i in range(1, N_PLANS + 1)]})
+    paths = pd.DataFrame({"fin_path": np.arange(1, N_PATHS + 1),
+                          "fin_path_t": [f"Path {i}" for i in range(1, N_PATHS + 1)]})
+
+    user_ids = np.arange(1, users + 1)
+    users_df = pd.DataFrame({"uname": [f"user_{i}" for i in user_ids],
+                             "pword": "x",
+                             "email": [f"user_{i}@example.com" for i in user_ids]})
+
+    owner = np.repeat(user_ids, accounts_per_user)
+    number = np.tile(np.arange(1, accounts_per_user + 1), users)
+    popularity = 1 / np.arange(1, N_COMPANIES + 1)
+    accounts = pd.DataFrame({"account_num": [f"ACC-{u}-{a}" for u, a in zip(owner, number)],
+                             "uname": [f"user_{u}" for u in owner],
+                             "company": rng.choice(company_ids, size=len(owner), p=popularity / popularity.sum()),
+                             "plan": rng.integers(1, N_PLANS + 1, len(owner)),
+                             "fin_path": rng.integers(1, N_PATHS + 1, len(owner))})
+
+    # account i has months - opened[i] monthly updates, starting at month opened[i]
+    opened = rng.integers(0, max(months // 2, 1), len(accounts))
+    lengths = months - opened
+    account_index = np.repeat(np.arange(len(accounts)), lengths)
+    month_index = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths) + opened[account_index]
+    log_returns = rng.normal(0.005, 0.03, lengths.sum())
+    walk = pd.Series(log_returns).groupby(account_index).cumsum().to_numpy()
+    initial = rng.lognormal(10, 1, len(accounts))[account_index]
+    updates = pd.DataFrame({"account_num": accounts["account_num"].to_numpy()[account_index],
+                            "money": np.round(np.minimum(initial * np.exp(walk), 99999999.99), 2),
+                            "begda": pd.date_range(start, periods=months, freq="MS").date[month_index]})
+
+    return {"company_types": company_types, "companies": companies, "financial_plans": financial_plans,
+            "paths": paths, "users": users_df, "accounts": accounts, "updates": updates}
+
+
+def load(engine, frames, replace=False):
+    """COPY generated frames into an (already migrated) database and rebuild the rollup.
+
+    Refuses to touch a database that already has users unless replace is set,
+    in which case every StackSight table is truncated first.
+    """
+    with engine.begin() as conn:
+        if conn.execute(text("SELECT count(*) FROM users")).scalar():
+            if not replace:
+                raise RuntimeError("Database already has data; pass replace=True to truncate it.")
+            conn.execute(text(f"TRUNCATE {', '.join(_TABLES)}, balance_rollup CASCADE"))
+        for table in _TABLES:
+            copy_frame(conn, frames[table], table)
+        for table, column in _SERIALS:
+            conn.execute(text(f"SELECT setval(pg_get_serial_sequence('{table}', '{column}'), max({column})) FROM {table}"))
+        for statement in REBUILD_STATEMENTS:
+            conn.execute(text(statement))
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("VACUUM ANALYZE"))
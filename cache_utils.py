@@ -0,0 +1,223 @@
+"""Result cache shared between Streamlit replicas.
+
+Values are pickled once and kept in two tiers: an in-process LRU bounded by
+bytes, in front of an optional shared store. Entries never need deleting on
+writes: callers put the data versions they depend on (db_utils.versions)
+into the key, so a write simply makes the next lookup use a new key. TTLs
+only bound storage.
+
+Configured in the [cache] section of secrets:
+
+    backend = "sqlite"            # default "memory": the LRU tier alone
+    path = "/var/lib/stacksight/cache.sqlite3"
+    local_bytes = 268435456
+    ttl_seconds = 3600
+
+The SQLite tier is shared by the processes of one host only: its WAL mode
+does not work on network filesystems. Replicas on several hosts need a
+networked store, plugged in with register_backend(name, factory); a tier is
+any object with get(key) -> bytes or None and set(key, value).
+
+Shared entries are unpickled, so whoever can write the store can run code
+in the app. The SQLite file must live in a directory owned by this user
+and writable by no one else; there is no default path.
+"""
+import hashlib
+import logging
+import os
+import pickle
+import random
+import sqlite3
+import stat
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from streamlit import secrets
+
+from metrics_utils import increment
+
+
+# bump when the shape of a cached value changes, so replicas running the new code ignore old entries
+KEY_VERSION = 1
+
+CACHE_DEFAULTS = {"backend": "memory",
+                  "path": None,
+                  "local_bytes": 256 * 2 ** 20,
+                  "ttl_seconds": 3600}
+
+PRUNE_PROBABILITY = 0.01  # share of shared-tier writes that also delete expired entries
+
+log = logging.getLogger("stacksight.cache")
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+class MemoryCache:
+    """In-process LRU of serialized values, bounded by their total size."""
+
+    name = "memory"
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            self._bytes += len(value) - (len(old) if old is not None else 0)
+            self._entries[key] = value
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+
+class SQLiteCache:
+    """Shared tier in a SQLite file; every process on the host sees the same entries.
+
+    Errors are logged and treated as misses, so a locked or full store slows
+    pages down instead of breaking them.
+    """
+
+    name = "shared"
+
+    def __init__(self, path, ttl_seconds):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+
+    def _connect(self):
+        # one connection per thread, and a new one after a fork
+        if getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""CREATE TABLE IF NOT EXISTS entries (
+                                key TEXT PRIMARY KEY,
+                                value BLOB NOT NULL,
+                                expires_at REAL NOT NULL)""")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return self._local.conn
+
+    def get(self, key):
+        try:
+            row = self._connect().execute("SELECT value FROM entries WHERE key = ? AND expires_at > ?",
+                                          (key, time.time())).fetchone()
+        except sqlite3.Error as error:
+            log.warning("shared cache read failed: %s", error)
+            return None
+        return row[0] if row else None
+
+    def set(self, key, value):
+        now = time.time()
+        try:
+            conn = self._connect()
+            conn.execute("INSERT OR REPLACE INTO entries (key, value, expires_at) VALUES (?, ?, ?)",
+                         (key, value, now + self.ttl_seconds))
+            if random.random() < PRUNE_PROBABILITY:
+                conn.execute("DELETE FROM entries WHERE expires_at <= ?", (now,))
+        except sqlite3.Error as error:
+            log.warning("shared cache write failed: %s", error)
+
+
+class TieredCache:
+    """Looks up each tier in order; a hit is copied into the faster tiers in front of it."""
+
+    def __init__(self, tiers):
+        self.tiers = tiers
+
+    def get(self, key, cache):
+        for i, tier in enumerate(self.tiers):
+            value = tier.get(key)
+            if value is not None:
+                increment("stacksight_cache_tier_hits_total", cache=cache, tier=tier.name)
+                for faster in self.tiers[:i]:
+                    faster.set(key, value)
+                return value
+        return None
+
+    def set(self, key, value):
+        for tier in self.tiers:
+            tier.set(key, value)
+
+
+def check_private(path):
+    """Raise PermissionError unless path (if it exists) is owned by this user and writable by no one else."""
+    if not os.path.exists(path):
+        return
+    info = os.stat(path)
+    if info.st_uid != os.getuid() or info.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise PermissionError(f"{path} must be owned by this user and not group- or world-writable")
+
+
+def _sqlite_backend(config):
+    path = config["path"]
+    if not path:
+        raise ValueError("[cache] backend = \"sqlite\" needs an explicit [cache] path")
+    path = os.path.abspath(path)
+    # another user able to replace the file could make the app unpickle anything
+    for checked in (os.path.dirname(path), path, f"{path}-wal", f"{path}-shm"):
+        check_private(checked)
+    return SQLiteCache(path, float(config["ttl_seconds"]))
+
+
+# backend name -> factory(config) for the shared tier, or None for the in-process tier alone
+BACKENDS = {"memory": lambda config: None,
+            "sqlite": _sqlite_backend}
+
+
+def register_backend(name, factory):
+    """Make a shared tier selectable as [cache] backend = name."""
+    BACKENDS[name] = factory
+
+
+def get_cache():
+    """Process-wide TieredCache built from the [cache] secrets."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            settings = secrets.get("cache", {})
+            config = {key: settings.get(key, default) for key, default in CACHE_DEFAULTS.items()}
+            shared = BACKENDS[config["backend"]](config)
+            _cache = TieredCache([MemoryCache(int(config["local_bytes"]))] + ([shared] if shared else []))
+    return _cache
+
+
+def cache_key(cache, args):
+    digest = hashlib.sha256(pickle.dumps((KEY_VERSION, args), protocol=pickle.HIGHEST_PROTOCOL)).hexdigest()
+    return f"{cache}:{digest}"
+
+
+def cached(cache, args, compute):
+    """compute() through the shared cache under (cache, args); every hit returns a fresh copy."""
+    key = cache_key(cache, args)
+    tiers = get_cache()
+    value = tiers.get(key, cache)
+    if value is not None:
+        return pickle.loads(value)
+    result = compute()
+    tiers.set(key, pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL))
+    return result
+
+
+def memoize(cache):
+    """Decorator caching a function by its positional arguments, which must include any data versions it reads."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args):
+            return cached(cache, args, lambda: func(*args))
+        return wrapper
+    return decorator
@@ -0,0 +1,104 @@
+"""Charts page pipeline: rollup frame -> resampled, downsampled series -> cached Plotly figure JSON.
+
+Balances are stocks, so coarser granularities keep the last month of each
+period rather than summing. Series longer than their share of POINT_BUDGET
+are reduced with Largest-Triangle-Three-Buckets, which keeps the peaks and
+troughs a plain stride would drop, and figures with more than WEBGL_POINTS
+points are drawn with WebGL traces.
+"""
+import numpy as np
+import pandas as pd
+import plotly.express as px
+
+from cache_utils import memoize
+from db_utils import data_version
+from metrics_utils import cache_request, cache_miss, timer
+from rollup_utils import rollup_separated, rollup_combined
+
+
+# label -> (pandas period start alias, tick format, tick spacing)
+GRANULARITIES = {"Month": ("MS", "%b %Y", "M1"),
+                 "Quarter": ("QS", "%b %Y", "M3"),
+                 "Year": ("YS", "%Y", "M12")}
+
+POINT_BUDGET = 2000  # points per figure, shared between its traces
+MIN_TRACE_POINTS = 100  # never reduce a trace below this many points
+WEBGL_POINTS = 1000  # Plotly's SVG traces get slow above roughly this many points
+
+
+def resample(df, granularity, color=None):
+    """Last balance of each month/quarter/year, per color group."""
+    rule = GRANULARITIES[granularity][0]
+    if rule == "MS":  # the rollup is already monthly
+        return df
+    keys = ([color] if color else []) + [pd.Grouper(key="Date", freq=rule)]
+    return df.groupby(keys)["Amount Of Money"].last().dropna().reset_index()
+
+
+def lttb(x, y, threshold):
+    """Indices of the points Largest-Triangle-Three-Buckets keeps; the first and last are always kept."""
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    # threshold - 2 buckets between the fixed first and last points
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    keep = np.empty(threshold, dtype=int)
+    keep[0], keep[-1] = 0, n - 1
+    selected = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        next_start, next_end = (edges[i + 1], edges[i + 2]) if i + 2 < len(edges) else (n - 1, n)
+        avg_x, avg_y = x[next_start:next_end].mean(), y[next_start:next_end].mean()
+        # twice the triangle area between the last kept point, each candidate and the next bucket's average
+        area = np.abs((x[selected] - avg_x) * (y[start:end] - y[selected])
+                      - (x[selected] - x[start:end]) * (avg_y - y[selected]))
+        selected = start + int(area.argmax())
+        keep[i + 1] = selected
+    return keep
+
+
+def downsample(df, color=None, budget=POINT_BUDGET):
+    """Reduce every trace to its share of the point budget."""
+    groups = [df] if color is None else [group for _, group in df.groupby(color, sort=False)]
+    threshold = max(budget // max(len(groups), 1), MIN_TRACE_POINTS)
+    if all(len(group) <= threshold for group in groups):
+        return df
+    reduced = []
+    for group in groups:
+        x = group["Date"].to_numpy(dtype="datetime64[ns]").astype(np.int64)
+        reduced.append(group.iloc[lttb(x, group["Amount Of Money"].to_numpy(dtype=float), threshold)])
+    return pd.concat(reduced, ignore_index=True)
+
+
+def line_figure(df, y, color=None, granularity="Month"):
+    """Plotly figure JSON of y over Date, with WebGL traces for large frames."""
+    _, tickformat, dtick = GRANULARITIES[granularity]
+    fig = px.line(df, x="Date", y=y, color=color, render_mode="webgl" if len(df) > WEBGL_POINTS else "svg")
+    fig.update_xaxes(tickformat=tickformat, dtick=dtick)
+    return fig.to_json()
+
+
+def build_figure(df, granularity, color=None):
+    """Plotly figure JSON for a Date / Amount Of Money frame."""
+    return line_figure(downsample(resample(df, granularity, color), color), "Amount Of Money", color, granularity)
+
+
+@memoize("chart_figure")
+def _chart_figure(username, version, chart, dimension, label, selected, granularity):
+    cache_miss("chart_figure")
+    selected = None if selected is None else list(selected)
+    if chart == "Separated":
+        df, color = rollup_separated(username, dimension, label, selected), label
+    else:
+        df, color = rollup_combined(username, dimension, selected), None
+    with timer("stacksight_render_seconds", step="build_figure"):
+        return build_figure(df, granularity, color)
+
+
+def chart_figure(username, chart, dimension, label, selected=None, granularity="Month"):
+    """Figure JSON for the Separated or Combined chart (all values if selected is None), rebuilt only when its inputs change."""
+    cache_request("chart_figure")
+    key = None if selected is None else tuple(sorted(str(value) for value in selected))
+    return _chart_figure(username, data_version(username), chart, dimension, label, key, granularity)
@@ -0,0 +1,106 @@
+import pandas as pd
+from streamlit import cache_resource
+
+from cache_utils import memoize
+from db_utils import read_query_df, data_version
+from metrics_utils import cache_request, cache_miss
+
+
+# every column the Charts and Tables pages filter or group by
+CATEGORY_COLUMNS = ["account_num", "company_t", "ctype_t", "plan_t", "fin_path_t"]
+
+# chart/table dimensions: label -> rollup and dataset column
+FILTER_DICT = {"Account Number": "account_num",
+               "Company": "company_t",
+               "Company Type": "ctype_t",
+               "Financial Plan": "plan_t",
+               "Financial Path": "fin_path_t"}
+
+ACCOUNTS_QUERY = "SELECT account_num FROM accounts WHERE uname = :username ORDER BY account_num"
+
+ACCOUNT_INFO_QUERY = """SELECT company_t, plan_t, fin_path_t, company_link
+                    FROM accounts
+                    INNER JOIN companies ON accounts.company = companies.company
+                    INNER JOIN financial_plans ON accounts.plan = financial_plans.plan
+                    INNER JOIN paths ON accounts.fin_path = paths.fin_path
+                    WHERE account_num = :account_num"""
+
+# account_num plus ACCOUNT_INFO_QUERY's columns for the user's first account (a selectbox's default)
+FIRST_ACCOUNT_INFO_QUERY = """SELECT account_num, company_t, plan_t, fin_path_t, company_link
+                    FROM accounts
+                    INNER JOIN companies ON accounts.company = companies.company
+                    INNER JOIN financial_plans ON accounts.plan = financial_plans.plan
+                    INNER JOIN paths ON accounts.fin_path = paths.fin_path
+                    WHERE uname = :username
+                    ORDER BY account_num
+                    LIMIT 1"""
+
+# one backward probe of updates(account_num, begda DESC) per selected account
+_LATEST = """SELECT accounts.account_num "Account Number",
+                    companies.company_t "Company",
+                    company_types.ctype_t "Company Type",
+                    financial_plans.plan_t "Plan",
+                    paths.fin_path_t "Path",
+                    latest.money "Amount Of Money",
+                    latest.begda "Last Updated"
+                    FROM accounts
+                    INNER JOIN companies ON accounts.company = companies.company
+                    INNER JOIN company_types ON companies.ctype = company_types.ctype
+                    INNER JOIN financial_plans ON accounts.plan = financial_plans.plan
+                    INNER JOIN paths ON accounts.fin_path = paths.fin_path
+                    CROSS JOIN LATERAL (SELECT updates.money, updates.begda FROM updates
+                                        WHERE updates.account_num = accounts.account_num
+                                        ORDER BY updates.begda DESC
+                                        LIMIT 1) AS latest
+                    WHERE accounts.uname = :username
+                    {account_filter}
+                    ORDER BY accounts.account_num"""
+
+LATEST_QUERY = _LATEST.format(account_filter="AND accounts.account_num IN :accounts")
+# every account of the user, the Tables page default; needs no account list first
+LATEST_ALL_QUERY = _LATEST.format(account_filter="")
+
+DATASET_QUERY = """SELECT updates.account_num, updates.money, updates.begda,
+                    companies.company_t, company_types.ctype_t,
+                    financial_plans.plan_t, paths.fin_path_t
+                    FROM updates
+                    INNER JOIN accounts ON updates.account_num = accounts.account_num
+                    INNER JOIN companies ON accounts.company = companies.company
+                    INNER JOIN financial_plans ON accounts.plan = financial_plans.plan
+                    INNER JOIN paths ON accounts.fin_path = paths.fin_path
+                    INNER JOIN company_types ON companies.ctype = company_types.ctype
+                    WHERE accounts.uname = :username"""
+
+
+@cache_resource(max_entries=256, show_spinner=False)
+def _load_dataset(username, version):
+    # version only takes part in the cache key; a bump makes the next call reload
+    cache_miss("dataset")
+    df = read_query_df(DATASET_QUERY, params={"username": username})
+    df = df.astype({column: "category" for column in CATEGORY_COLUMNS})
+    df["begda"] = pd.to_datetime(df["begda"])
+    return df
+
+
+def get_user_dataset(username):
+    """The user's joined updates/accounts frame, shared between reruns.
+
+    The frame is cached as a resource (not copied per call), so views must not
+    mutate it.
+    """
+    cache_request("dataset")
+    return _load_dataset(username, data_version(username))
+
+
+@memoize("latest_balances")
+def _latest_balances(username, version, accounts):
+    cache_miss("latest_balances")
+    if accounts is None:
+        return read_query_df(LATEST_ALL_QUERY, params={"username": username})
+    return read_query_df(LATEST_QUERY, params={"username": username, "accounts": list(accounts)})
+
+
+def latest_balances(username, accounts=None):
+    """Most recent update of every selected account (every account if None)."""
+    cache_request("latest_balances")
+    return _latest_balances(username, data_version(username), None if accounts is None else tuple(accounts))
@@ -1,75 +1,395 @@
-from sqlalchemy import text, bindparam, create_engine
+from sqlalchemy import text, bindparam, create_engine, event
+from sqlalchemy.engine import URL
 import pandas as pd
-from streamlit import secrets, cache_data
+from streamlit import secrets, cache_resource
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
 import bcrypt
+import io
+import re
+import threading
+import time
+from metrics_utils import query_timer
 
 
-user = secrets["postgres"]["user"]
-password = secrets["postgres"]["password"]
-host = secrets["postgres"]["host"]
-port = secrets["postgres"]["port"]
-database = secrets["postgres"]["database"]
+# pool settings, overridable in the [postgres] section of secrets
+POOL_DEFAULTS = {"pool_size": 5,
+                 "max_overflow": 10,
+                 "pool_timeout": 30,
+                 "pool_recycle": 1800,
+                 "pool_pre_ping": True}
 
-engine = create_engine(f'postgresql+psycopg2://{user}:{password}@{host}:{port}/{database}')
+# threads for speculative submit_query work ([postgres] speculative_workers), kept small so
+# guesses never hold more than a few connections; fan_out's pool defaults to one thread per
+# connection the engine may open ([postgres] fanout_workers)
+SPECULATIVE_WORKERS = 2
 
+# tables whose writes change a user's data (dataset_utils, rollup_utils); they are versioned
+# per user, so writers of different users never queue on one cache_versions row
+USER_DATA_TABLES = {"updates", "accounts", "balance_rollup"}
 
-def read_query_df(query_str, params=None):
+# how long a replica trusts the versions it last read from cache_versions ([cache] version_ttl_seconds);
+# writes made by this replica are seen at once, other replicas' writes within this many seconds
+VERSION_TTL_SECONDS = 1.0
 
-    params = params or {}
+VERSIONS_QUERY = "SELECT scope, version FROM cache_versions WHERE scope IN :scopes"
+_BUMP = """INSERT INTO cache_versions (scope, version) {rows}
+           ON CONFLICT (scope) DO UPDATE SET version = cache_versions.version + 1
+           RETURNING scope, version"""
+ALL_USERS = "user:*"  # write_scopes marker: a write to USER_DATA_TABLES that may touch any user
+
+_versions = {}  # scope -> (version, monotonic time read)
+_versions_lock = threading.Lock()
+
+# PostgreSQL type OIDs that read_query_arrow decodes natively, as pyarrow type aliases; other types are read as text
+ARROW_TYPE_ALIASES = {16: "bool", 20: "int64", 21: "int64", 23: "int64", 700: "double", 701: "double",
+                      1700: "double", 1082: "date32", 1114: "timestamp[us]"}
+
+_arrow_columns = {}  # query_str -> [(column name, type OID)], described once with LIMIT 0
+
+_pool_options = {}  # per-process overrides of POOL_DEFAULTS/secrets, see set_pool_options
+
+_executors = {}  # "fanout" / "speculative" -> ThreadPoolExecutor
+_executors_lock = threading.Lock()
+
+_pool_stats = {"connects": 0, "checkouts": 0, "checkins": 0, "waits": 0, "wait_total": 0.0, "wait_max": 0.0}
+_pool_stats_lock = threading.Lock()
+
+
+def _count(stat):
+    with _pool_stats_lock:
+        _pool_stats[stat] += 1
 
-    # Identify which parameters are lists/tuples -> need expanding=True
-    bind_params = [
-        bindparam(name, expanding=True)
-        for name, value in params.items()
-        if isinstance(value, (list, tuple))
-    ]
 
-    query = text(query_str).bindparams(*bind_params)
+@cache_resource(show_spinner=False)
+def get_engine():
+    """Process-wide engine, shared by every Streamlit session."""
+    config = secrets["postgres"]
+    url = URL.create("postgresql+psycopg2",
+                     username=config["user"],
+                     password=config["password"],
+                     host=config["host"],
+                     port=config["port"],
+                     database=config["database"])
+    options = {key: config.get(key, default) for key, default in POOL_DEFAULTS.items()}
+    engine = create_engine(url, **{**options, **_pool_options})
 
-    return pd.read_sql_query(query, engine, params=params)
+    event.listen(engine, "connect", lambda *args: _count("connects"))
+    event.listen(engine.pool, "checkout", lambda *args: _count("checkouts"))
+    event.listen(engine.pool, "checkin", lambda *args: _count("checkins"))
+    return engine
 
 
-def run_query(query_str, params=None):
+def set_pool_options(**options):
+    """Override pool settings for this process, e.g. one connection per batch worker; call before the first query."""
+    _pool_options.update(options)
 
+
+def pool_stats():
+    """Snapshot of pool occupancy and checkout wait times for this process."""
+    pool = get_engine().pool
+    with _pool_stats_lock:
+        stats = dict(_pool_stats)
+    stats["wait_avg"] = stats["wait_total"] / stats["waits"] if stats["waits"] else 0.0
+    stats.update(size=pool.size(), checked_in=pool.checkedin(),
+                 checked_out=pool.checkedout(), overflow=pool.overflow())
+    return stats
+
+
+@contextmanager
+def connection(transaction=False):
+    """Check out a pooled connection, recording how long the checkout waited."""
+    start = time.perf_counter()
+    with get_engine().connect() as conn:
+        waited = time.perf_counter() - start
+        with _pool_stats_lock:
+            _pool_stats["waits"] += 1
+            _pool_stats["wait_total"] += waited
+            _pool_stats["wait_max"] = max(_pool_stats["wait_max"], waited)
+        if transaction:
+            with conn.begin():
+                yield conn
+        else:
+            yield conn
+
+
+@lru_cache(maxsize=512)
+def _compile(query_str, expanding):
+    return text(query_str).bindparams(*[bindparam(name, expanding=True) for name in expanding])
+
+
+def prepare_query(query_str, params=None):
+    """Cached TextClause for a query, keyed by its SQL and which params are lists/tuples."""
     params = params or {}
+    # lists/tuples -> need expanding=True
+    expanding = tuple(sorted(name for name, value in params.items() if isinstance(value, (list, tuple))))
+    return _compile(query_str, expanding), params
+
+
+def _get_executor(kind):
+    with _executors_lock:
+        if kind not in _executors:
+            config = secrets["postgres"]
+            if kind == "fanout":
+                pool = {key: _pool_options.get(key, config.get(key, POOL_DEFAULTS[key]))
+                        for key in ("pool_size", "max_overflow")}
+                workers = int(config.get("fanout_workers", pool["pool_size"] + pool["max_overflow"]))
+            else:
+                workers = int(config.get("speculative_workers", SPECULATIVE_WORKERS))
+            _executors[kind] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"{kind}-query")
+        return _executors[kind]
+
+
+def submit_query(func, *args, **kwargs):
+    """Start speculative func(*args, **kwargs) in the background and return its Future.
+
+    For work whose result may turn out not to be needed, e.g. the page a user
+    is likely to open next. It runs on its own small pool, so it never queues
+    ahead of fan_out's page queries; a caller that needs the result and finds
+    it not started yet can cancel() it and run it itself.
+    """
+    return _get_executor("speculative").submit(func, *args, **kwargs)
+
+
+def fan_out(*calls):
+    """Run independent (func, *args) calls concurrently; returns their results in order.
+
+    The first call runs on the calling thread and the others on the fan-out
+    pool, each with its own pooled connection, so the batch takes about as
+    long as its slowest call. The first exception raised is re-raised.
+    """
+    (func, *args), rest = calls[0], calls[1:]
+    futures = [_get_executor("fanout").submit(other, *other_args) for other, *other_args in rest]
+    first = func(*args)
+    return [first] + [future.result() for future in futures]
+
+
+def written_tables(query_str):
+    """Tables targeted by INSERT/UPDATE/DELETE statements in a query."""
+    return {table.lower() for table in
+            re.findall(r"(?:\bINSERT\s+INTO|(?<!DO\s)\bUPDATE|\bDELETE\s+FROM)\s+(\w+)", query_str, re.IGNORECASE)}
+
+
+def write_scopes(tables, username=None):
+    """cache_versions scopes a write to `tables` invalidates.
+
+    USER_DATA_TABLES are versioned per user: user:<name>, or ALL_USERS when
+    the write is not for one user (e.g. rebuilding the rollup). Other tables
+    are versioned as table:<name>.
+    """
+    scopes = set()
+    for table in tables:
+        if table in USER_DATA_TABLES:
+            scopes.add(f"user:{username}" if username is not None else ALL_USERS)
+        else:
+            scopes.add(f"table:{table}")
+    return scopes
+
+
+def bump_versions(conn, tables, username=None):
+    """Bump the versions a write invalidates, inside the caller's transaction.
+
+    Pass the result to remember_versions once the transaction has committed.
+    Scopes are bumped in sorted order so concurrent writers lock them in the
+    same order.
+    """
+    scopes = write_scopes(tables, username)
+    bumped = {}
+    if ALL_USERS in scopes:
+        scopes.discard(ALL_USERS)
+        rows = conn.execute(text(_BUMP.format(rows="SELECT 'user:' || uname, 1 FROM users ORDER BY 1")))
+        bumped.update(rows.fetchall())
+    if scopes:
+        scopes = sorted(scopes)
+        values = ", ".join(f"(:scope_{i}, 1)" for i in range(len(scopes)))
+        rows = conn.execute(text(_BUMP.format(rows=f"VALUES {values}")),
+                            {f"scope_{i}": scope for i, scope in enumerate(scopes)})
+        bumped.update(rows.fetchall())
+    return bumped
+
+
+def remember_versions(bumped):
+    """Record committed versions, so this replica's next reads use them without a round trip."""
+    now = time.monotonic()
+    with _versions_lock:
+        for scope, version in bumped.items():
+            # versions only grow; never let an older concurrent read win
+            _versions[scope] = (max(version, _versions.get(scope, (0, 0))[0]), now)
+
+
+def versions(scopes):
+    """Current versions of cache_versions scopes, in order; scopes never written are 0."""
+    ttl = float(secrets.get("cache", {}).get("version_ttl_seconds", VERSION_TTL_SECONDS))
+    now = time.monotonic()
+    with _versions_lock:
+        stale = sorted({scope for scope in scopes if scope not in _versions or now - _versions[scope][1] > ttl})
+    if stale:
+        found = dict(return_run_query(query_str=VERSIONS_QUERY, params={"scopes": stale}))
+        remember_versions({scope: found.get(scope, 0) for scope in stale})
+    with _versions_lock:
+        return tuple(_versions[scope][0] for scope in scopes)
 
-    # Identify which parameters are lists/tuples -> need expanding=True
-    bind_params = [
-        bindparam(name, expanding=True)
-        for name, value in params.items()
-        if isinstance(value, (list, tuple))
-    ]
 
-    query = text(query_str).bindparams(*bind_params)
+def data_version(username):
+    """Current version of a user's data, bumped by every write to USER_DATA_TABLES on any replica."""
+    return versions([f"user:{username}"])[0]
 
-    with engine.begin() as conn:
-        conn.execute(query, params)
+
+def read_query_df(query_str, params=None):
+
+    query, params = prepare_query(query_str, params)
+
+    with query_timer("read_df", query_str, params) as stats, connection() as conn:
+        df = pd.read_sql_query(query, conn, params=params)
+        stats["rows"] = len(df)
+        return df
+
+
+def read_query_chunks(query_str, params=None, chunk_size=10000):
+    "yield the result as DataFrames of at most chunk_size rows, read through a server-side cursor"
+
+    query, params = prepare_query(query_str, params)
+
+    with query_timer("stream", query_str, params) as stats, connection() as conn:
+        stats["rows"] = 0
+        result = conn.execution_options(stream_results=True, yield_per=chunk_size).execute(query, params)
+        columns = list(result.keys())
+        for rows in result.partitions():
+            stats["rows"] += len(rows)
+            yield pd.DataFrame.from_records(rows, columns=columns)
+
+
+def arrow_schema(description):
+    """Arrow schema of a result, from its DB-API description.
+
+    Types follow copy_to_arrow, except that NUMERIC(p, s) keeps its exact
+    decimal type; unconstrained NUMERIC is read as double.
+    """
+    import pyarrow as pa
+
+    fields = []
+    for column in description:
+        if column.type_code == 1700 and column.precision and column.precision <= 38:
+            arrow_type = pa.decimal128(column.precision, column.scale)
+        else:
+            arrow_type = pa.type_for_alias(ARROW_TYPE_ALIASES.get(column.type_code, "string"))
+        fields.append(pa.field(column.name, arrow_type))
+    return pa.schema(fields)
+
+
+def _arrow_values(values, arrow_type):
+    import pyarrow as pa
+
+    # psycopg2 returns Decimal for NUMERIC and driver objects for types read as text
+    if pa.types.is_floating(arrow_type):
+        return [None if value is None else float(value) for value in values]
+    if pa.types.is_string(arrow_type):
+        return [None if value is None else str(value) for value in values]
+    return values
+
+
+def read_query_batches(query_str, params=None, chunk_size=10000):
+    "like read_query_chunks, but yields pyarrow RecordBatches typed from the result description (see arrow_schema)"
+    import pyarrow as pa
+
+    query, params = prepare_query(query_str, params)
+
+    with query_timer("stream", query_str, params) as stats, connection() as conn:
+        stats["rows"] = 0
+        result = conn.execution_options(stream_results=True, yield_per=chunk_size).execute(query, params)
+        schema = arrow_schema(result.cursor.description)
+        for rows in result.partitions():
+            stats["rows"] += len(rows)
+            values = list(zip(*rows))
+            yield pa.RecordBatch.from_arrays(
+                [pa.array(_arrow_values(column, field.type), type=field.type) for column, field in zip(values, schema)],
+                schema=schema)
+
+
+def read_query_arrow(query_str, params=None, dictionary_columns=()):
+    """Read a query into a pyarrow Table (see copy_to_arrow); st.dataframe displays it as is."""
+
+    with query_timer("read_arrow", query_str, params) as stats, connection() as conn:
+        table = copy_to_arrow(conn, query_str, params, dictionary_columns)
+        stats["rows"] = table.num_rows
+        return table
+
+
+def run_query(query_str, params=None, username=None):
+    "run a write query; pass username so the user's cached dataset is invalidated"
+
+    query, params = prepare_query(query_str, params)
+
+    with query_timer("write", query_str, params) as stats, connection(transaction=True) as conn:
+        stats["rows"] = conn.execute(query, params).rowcount
+        bumped = bump_versions(conn, written_tables(query_str), username)
+
+    remember_versions(bumped)
+
+def run_queries(statements, username=None):
+    "run several (query_str, params) statements in a single transaction"
+
+    tables = set()
+    with connection(transaction=True) as conn:
+        for query_str, params in statements:
+            query, params = prepare_query(query_str, params)
+            with query_timer("write", query_str, params) as stats:
+                stats["rows"] = conn.execute(query, params).rowcount
+            tables |= written_tables(query_str)
+        bumped = bump_versions(conn, tables, username)
+
+    remember_versions(bumped)
 
 def return_run_query(query_str, params=None):
     "return a query not as a DataFrame"
 
-    params = params or {}
+    query, params = prepare_query(query_str, params)
+
+    with query_timer("read", query_str, params) as stats, connection(transaction=True) as conn:
+        rows = conn.execute(query, params).fetchall()
+        stats["rows"] = len(rows)
+        return rows
+
+def copy_frame(conn, df, table):
+    "stream a DataFrame into a table with PostgreSQL COPY, inside the caller's transaction"
+
+    buffer = io.StringIO()
+    df.to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+    columns = ", ".join(df.columns)
+    with conn.connection.cursor() as cursor:
+        cursor.copy_expert(f"COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+def copy_to_arrow(conn, query_str, params=None, dictionary_columns=()):
+    """Read a query into a pyarrow Table without building a Python object per value.
+
+    The result is streamed with COPY ... TO STDOUT and parsed by Arrow's CSV
+    reader, typed from the result description (NUMERIC as double, like
+    read_query_df); dictionary_columns are dictionary-encoded text.
+    """
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+
+    query, params = prepare_query(query_str, params)
+    # COPY takes no bind parameters, so let the driver inline them
+    expanded = query.compile(dialect=conn.dialect).construct_expanded_state(params)
+    buffer = io.BytesIO()
+    with conn.connection.cursor() as cursor:
+        sql = cursor.mogrify(expanded.statement, expanded.parameters).decode("utf-8")
+        if query_str not in _arrow_columns:
+            cursor.execute(f"SELECT * FROM ({sql}) AS result LIMIT 0")
+            _arrow_columns[query_str] = [(column.name, column.type_code) for column in cursor.description]
+        cursor.copy_expert(f"COPY ({sql}) TO STDOUT WITH (FORMAT csv, HEADER)", buffer)
+    buffer.seek(0)
 
-    # Identify which parameters are lists/tuples -> need expanding=True
-    bind_params = [
-        bindparam(name, expanding=True)
-        for name, value in params.items()
-        if isinstance(value, (list, tuple))
-    ]
-
-    query = text(query_str).bindparams(*bind_params)
-
-    with engine.begin() as conn:
-        return conn.execute(query, params).fetchall()
-    
-@cache_data
-def cache_read_query(query_str, params=None):
-    
-    return return_run_query(query_str, params)
-
-@cache_data
-def cache_general_data(data):
-    return data
+    column_types = {name: pa.dictionary(pa.int32(), pa.string()) if name in dictionary_columns
+                    else pa.type_for_alias(ARROW_TYPE_ALIASES.get(oid, "string"))
+                    for name, oid in _arrow_columns[query_str]}
+    # COPY writes NULL unquoted and '' quoted, so only unquoted empty fields are nulls; booleans are t / f
+    return pa_csv.read_csv(buffer, convert_options=pa_csv.ConvertOptions(
+        column_types=column_types, strings_can_be_null=True, quoted_strings_can_be_null=False,
+        true_values=["t"], false_values=["f"]))
 
 def hash_password(password):
     """Hash a password using bcrypt."""
@@ -0,0 +1,72 @@
+"""In-process cache of the small reference tables behind every account.
+
+Each table is held as a bidirectional id <-> label map. After TTL_SECONDS a
+single fingerprint query decides which tables changed, and only those are
+reloaded.
+"""
+import threading
+import time
+from collections import namedtuple
+
+from db_utils import return_run_query
+from metrics_utils import cache_request, cache_miss
+
+
+# table -> (id column, label column)
+DIMENSION_TABLES = {"companies": ("company", "company_t"),
+                    "financial_plans": ("plan", "plan_t"),
+                    "paths": ("fin_path", "fin_path_t"),
+                    "company_types": ("ctype", "ctype_t")}
+
+TTL_SECONDS = 300
+MAX_ROWS = 10000  # per table; reference tables are expected to stay far below this
+
+Dimension = namedtuple("Dimension", ["labels", "id_by_label", "label_by_id"])
+
+_dimensions = {}
+_fingerprints = {}
+_checked_at = None
+_lock = threading.Lock()
+
+
+def _fingerprint_query():
+    return "\nUNION ALL\n".join(
+        f"""SELECT '{table}', count(*), coalesce(sum(hashtext(CAST({id_col} AS TEXT) || ':' || {label_col})), 0)
+            FROM {table}"""
+        for table, (id_col, label_col) in DIMENSION_TABLES.items())
+
+
+def _load(table):
+    cache_miss("dimensions")
+    id_col, label_col = DIMENSION_TABLES[table]
+    rows = return_run_query(query_str=f"SELECT {id_col}, {label_col} FROM {table} ORDER BY {label_col} LIMIT :max_rows",
+                            params={"max_rows": MAX_ROWS})
+    return Dimension(labels=[row[1] for row in rows],
+                     id_by_label={row[1]: row[0] for row in rows},
+                     label_by_id={row[0]: row[1] for row in rows})
+
+
+def _refresh():
+    global _checked_at
+    fingerprints = {row[0]: (row[1], row[2]) for row in return_run_query(query_str=_fingerprint_query())}
+    for table, fingerprint in fingerprints.items():
+        if _fingerprints.get(table) != fingerprint or table not in _dimensions:
+            _dimensions[table] = _load(table)
+            _fingerprints[table] = fingerprint
+    _checked_at = time.monotonic()
+
+
+def get_dimension(table):
+    """Cached id <-> label maps for one of DIMENSION_TABLES."""
+    cache_request("dimensions")
+    with _lock:
+        if _checked_at is None or time.monotonic() - _checked_at > TTL_SECONDS:
+            _refresh()
+        return _dimensions[table]
+
+
+def invalidate_dimensions():
+    """Force a fingerprint check on the next lookup."""
+    global _checked_at
+    with _lock:
+        _checked_at = None
@@ -0,0 +1,130 @@
+"""Streaming export of account history to CSV or Parquet.
+
+Exports are written chunk by chunk to a file in a private temporary
+directory and served with a deferred st.download_button, so neither the
+query nor the download holds the whole history in memory between reruns.
+"""
+import os
+import tempfile
+import threading
+import time
+
+from db_utils import read_query_chunks, read_query_batches
+
+
+EXPORT_TTL_SECONDS = 3600  # exports left behind by closed sessions are removed after this long
+
+_export_dir = None
+_export_dir_lock = threading.Lock()
+
+
+class ExportFailed(Exception):
+    """Raised when an export could not be written; its partial file has been removed."""
+
+
+EXPORT_FORMATS = {"CSV": ("csv", "text/csv"),
+                  "Parquet": ("parquet", "application/vnd.apache.parquet")}
+
+EXPORT_QUERY = """SELECT accounts.account_num "Account Number",
+                    companies.company_t "Company",
+                    company_types.ctype_t "Company Type",
+                    financial_plans.plan_t "Plan",
+                    paths.fin_path_t "Path",
+                    updates.money "Amount Of Money",
+                    updates.begda "Date"
+                    FROM accounts
+                    INNER JOIN companies ON accounts.company = companies.company
+                    INNER JOIN company_types ON companies.ctype = company_types.ctype
+                    INNER JOIN financial_plans ON accounts.plan = financial_plans.plan
+                    INNER JOIN paths ON accounts.fin_path = paths.fin_path
+                    INNER JOIN updates ON accounts.account_num = updates.account_num
+                    WHERE accounts.uname = :username
+                    AND accounts.account_num IN :accounts
+                    ORDER BY updates.account_num, updates.begda DESC"""
+
+
+def _write_csv(params, file, chunk_size):
+    rows = 0
+    for chunk in read_query_chunks(EXPORT_QUERY, params=params, chunk_size=chunk_size):
+        file.write(chunk.to_csv(header=rows == 0, index=False).encode("utf-8"))
+        rows += len(chunk)
+    return rows
+
+
+def _write_parquet(params, file, chunk_size):
+    import pyarrow.parquet as pq
+
+    rows = 0
+    writer = None
+    try:
+        for batch in read_query_batches(EXPORT_QUERY, params=params, chunk_size=chunk_size):
+            if writer is None:
+                writer = pq.ParquetWriter(file, batch.schema)
+            writer.write_batch(batch)
+            rows += batch.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def export_history(username, accounts, export_format, file, chunk_size=10000):
+    """Write the selected accounts' history to a binary file object chunk by chunk.
+
+    Returns the row count and elapsed seconds. Memory stays flat as the
+    history grows; benchmarks/export_memory.py measures it.
+    """
+    params = {"username": username, "accounts": list(accounts)}
+    writer = _write_parquet if export_format == "Parquet" else _write_csv
+    start = time.perf_counter()
+    rows = writer(params, file, chunk_size)
+    return {"rows": rows, "seconds": time.perf_counter() - start}
+
+
+def _get_export_dir():
+    global _export_dir
+    with _export_dir_lock:
+        if _export_dir is None:
+            _export_dir = tempfile.mkdtemp(prefix="stacksight-exports-")  # readable by this user only
+    return _export_dir
+
+
+def remove_export(path):
+    if path:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def sweep_exports(max_age=EXPORT_TTL_SECONDS):
+    """Remove exports older than max_age seconds."""
+    directory = _get_export_dir()
+    cutoff = time.time() - max_age
+    for entry in os.scandir(directory):
+        if entry.stat().st_mtime < cutoff:
+            remove_export(entry.path)
+
+
+def export_to_file(username, accounts, export_format, chunk_size=10000):
+    """Export to a new file in the export directory; returns (path, export_history's result).
+
+    Raises ExportFailed if the query or the encoding fails.
+    """
+    sweep_exports()
+    extension, _ = EXPORT_FORMATS[export_format]
+    with tempfile.NamedTemporaryFile(dir=_get_export_dir(), suffix=f".{extension}", delete=False) as file:
+        path = file.name
+        try:
+            result = export_history(username, accounts, export_format, file, chunk_size)
+        except Exception as error:
+            file.close()
+            remove_export(path)
+            raise ExportFailed(f"{type(error).__name__}: {error}") from error
+    return path, result
+
+
+def read_export(path):
+    """Contents of a finished export; pass functools.partial(read_export, path) as a deferred download."""
+    with open(path, "rb") as file:
+        return file.read()
@@ -0,0 +1,96 @@
+"""Bulk import of monthly balances from CSV/Excel uploads.
+
+Rows are validated in one vectorized pass, COPYed into a temporary staging
+table and merged into `updates` (and the balance rollup) with set-based
+statements in a single transaction.
+"""
+import time
+
+import numpy as np
+import pandas as pd
+
+from db_utils import connection, copy_frame, prepare_query, bump_versions, remember_versions
+from rollup_utils import staged_delta_query, lock_accounts_query
+
+
+# accepted headers -> column name
+COLUMN_ALIASES = {"account_num": "account_num", "account number": "account_num", "account": "account_num",
+                  "money": "money", "amount of money": "money", "amount": "money",
+                  "begda": "begda", "date": "begda", "month": "begda"}
+
+MAX_MONEY = 99999999.99  # same bound as the Update Account form
+
+_MERGE = """INSERT INTO updates (account_num, money, begda)
+            SELECT staged.account_num, staged.money, staged.begda
+            FROM staging_updates AS staged
+            INNER JOIN accounts ON accounts.account_num = staged.account_num
+            WHERE accounts.uname = :username
+            ON CONFLICT (account_num, begda) DO UPDATE
+            SET money = EXCLUDED.money"""
+
+
+def read_upload(uploaded_file):
+    """Read an uploaded CSV or Excel (.xlsx) file into a DataFrame of strings."""
+    if uploaded_file.name.lower().endswith(".xlsx"):
+        return pd.read_excel(uploaded_file, dtype=str, engine="openpyxl")
+    return pd.read_csv(uploaded_file, dtype=str)
+
+
+def parse_balances(raw, account_options):
+    """Validate and type uploaded rows.
+
+    Returns (clean, rejects): clean has account_num, money and begda (first of
+    the month), deduplicated so the last row for an (account, month) wins;
+    rejects has the file row number and the reason each rejected row was dropped.
+    """
+    raw = raw.rename(columns=lambda column: COLUMN_ALIASES.get(str(column).strip().lower(), column))
+    missing = {"account_num", "money", "begda"} - set(raw.columns)
+    if missing:
+        raise ValueError(f"Missing column(s): {', '.join(sorted(missing))}")
+
+    df = pd.DataFrame({"row": raw.index + 2,  # 1-based, after the header line
+                       "account_num": raw["account_num"].fillna("").astype(str).str.strip(),
+                       "money": pd.to_numeric(raw["money"], errors="coerce"),
+                       "begda": pd.to_datetime(raw["begda"], errors="coerce")})
+    df["begda"] = df["begda"].dt.to_period("M").dt.to_timestamp()
+
+    reason = np.select(
+        [df["account_num"] == "",
+         ~df["account_num"].isin([str(account) for account in account_options]),
+         df["money"].isna(),
+         (df["money"] < 0) | (df["money"] > MAX_MONEY),
+         df["begda"].isna()],
+        ["Missing account number",
+         "Unknown account",
+         "Money is not a number",
+         f"Money must be between 0 and {MAX_MONEY:,.2f}",
+         "Date is not a valid date"],
+        default="")
+    valid = reason == ""
+    superseded = df.loc[valid].duplicated(["account_num", "begda"], keep="last").reindex(df.index, fill_value=False)
+    reason = np.where(superseded, "Superseded by a later row for the same account and month", reason)
+    rejected = reason != ""
+
+    rejects = pd.DataFrame({"Row": df.loc[rejected, "row"], "Reason": reason[rejected]})
+    clean = df.loc[~rejected, ["account_num", "money", "begda"]].assign(begda=lambda frame: frame["begda"].dt.date)
+    return clean, rejects
+
+
+def import_balances(username, clean):
+    """COPY validated rows into a staging table and merge them into `updates`.
+
+    Returns the number of rows merged and the rows/sec throughput.
+    """
+    start = time.perf_counter()
+    with connection(transaction=True) as conn:
+        conn.exec_driver_sql("CREATE TEMP TABLE staging_updates (LIKE updates INCLUDING DEFAULTS) ON COMMIT DROP")
+        copy_frame(conn, clean, "staging_updates")
+        conn.exec_driver_sql("ANALYZE staging_updates")
+        conn.exec_driver_sql(lock_accounts_query("staging_updates"))
+        conn.execute(*prepare_query(staged_delta_query("staging_updates"), {"username": username}))
+        merged = conn.execute(*prepare_query(_MERGE, {"username": username})).rowcount
+        bumped = bump_versions(conn, {"updates"}, username)
+    seconds = time.perf_counter() - start
+
+    remember_versions(bumped)
+    return {"rows": merged, "seconds": seconds, "rows_per_sec": merged / seconds if seconds else 0.0}
@@ -0,0 +1,224 @@
+"""Process-wide latency/size histograms, cache counters and a slow-query log.
+
+Metrics are kept in memory per process and exposed three ways: a developer
+sidebar panel (secrets `[metrics] panel = true`), Prometheus text format via
+prometheus_text(), and a periodic file dump (`[metrics] dump_path`) for a
+node-exporter textfile collector.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from streamlit import secrets
+
+
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROWS_BUCKETS = (1, 10, 100, 1000, 10000, 100000, 1000000)
+
+HELP = {"stacksight_query_seconds": "Database query latency.",
+        "stacksight_query_rows": "Rows returned or affected per query.",
+        "stacksight_page_seconds": "Full script run time per page.",
+        "stacksight_page_import_seconds": "First import of a page module in this process.",
+        "stacksight_render_seconds": "Time spent in chart/table render steps.",
+        "stacksight_cache_requests_total": "Cached lookups.",
+        "stacksight_cache_misses_total": "Cached lookups that had to compute the value.",
+        "stacksight_cache_tier_hits_total": "Cached lookups answered by the in-process or the shared tier."}
+
+slow_query_log = logging.getLogger("stacksight.slow_queries")
+
+_histograms = {}  # (name, labels) -> [bucket counts..., +Inf count, sum]
+_counters = {}  # (name, labels) -> value
+_lock = threading.Lock()
+_last_dump = 0.0
+
+
+def _setting(name, default):
+    return secrets.get("metrics", {}).get(name, default)
+
+
+def _buckets(name):
+    return ROWS_BUCKETS if name.endswith("_rows") else SECONDS_BUCKETS
+
+
+def observe(name, value, **labels):
+    """Add one observation to a histogram."""
+    key = (name, tuple(sorted(labels.items())))
+    buckets = _buckets(name)
+    with _lock:
+        series = _histograms.setdefault(key, [0] * (len(buckets) + 1) + [0.0])
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                series[i] += 1
+                break
+        else:
+            series[len(buckets)] += 1
+        series[-1] += value
+
+
+def increment(name, amount=1, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def cache_request(cache):
+    increment("stacksight_cache_requests_total", cache=cache)
+
+
+def cache_miss(cache):
+    """Call from inside a cached function body, which only runs on a miss."""
+    increment("stacksight_cache_misses_total", cache=cache)
+
+
+@contextmanager
+def timer(name, **labels):
+    """Observe the duration of a block that completes without raising."""
+    start = time.perf_counter()
+    yield
+    observe(name, time.perf_counter() - start, **labels)
+
+
+def param_shapes(params):
+    """Types (and list lengths) of bound parameters, without their values."""
+    return {name: f"{type(value).__name__}[{len(value)}]" if isinstance(value, (list, tuple)) else type(value).__name__
+            for name, value in (params or {}).items()}
+
+
+def query_fingerprint(query_str):
+    return hashlib.md5(" ".join(query_str.split()).encode("utf-8")).hexdigest()[:8]
+
+
+@contextmanager
+def query_timer(kind, query_str, params=None):
+    """Time a query; set stats["rows"] inside the block to record its row count."""
+    stats = {"rows": None}
+    start = time.perf_counter()
+    try:
+        yield stats
+    finally:
+        seconds = time.perf_counter() - start
+        fingerprint = query_fingerprint(query_str)
+        observe("stacksight_query_seconds", seconds, kind=kind, query=fingerprint)
+        if stats["rows"] is not None and stats["rows"] >= 0:
+            observe("stacksight_query_rows", stats["rows"], kind=kind, query=fingerprint)
+        if seconds >= float(_setting("slow_query_seconds", 0.5)):
+            slow_query_log.warning("slow %s query %s (%.3fs, rows=%s, params=%s): %s", kind, fingerprint, seconds,
+                                   stats["rows"], param_shapes(params), " ".join(query_str.split())[:1000])
+
+
+def quantile(series, q, buckets):
+    """Estimate a quantile from histogram counts by interpolating inside the bucket."""
+    counts = series[:-1]
+    total = sum(counts)
+    if not total:
+        return 0.0
+    rank = q * total
+    seen = 0
+    lower = 0.0
+    for count, upper in zip(counts, list(buckets) + [buckets[-1]]):
+        if count and seen + count >= rank:
+            return lower + (upper - lower) * (rank - seen) / count
+        seen += count
+        lower = upper
+    return buckets[-1]
+
+
+def summary(name):
+    """Rows of (labels, count, p50, p95, mean) for one histogram."""
+    with _lock:
+        items = [(labels, list(series)) for (metric, labels), series in _histograms.items() if metric == name]
+    rows = []
+    for labels, series in sorted(items):
+        count = sum(series[:-1])
+        rows.append({**dict(labels), "count": count,
+                     "p50": quantile(series, 0.5, _buckets(name)),
+                     "p95": quantile(series, 0.95, _buckets(name)),
+                     "mean": series[-1] / count if count else 0.0})
+    return rows
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{str(value)}"' for key, value in pairs) + "}"
+
+
+def prometheus_text():
+    """All metrics in Prometheus text exposition format."""
+    with _lock:
+        histograms = sorted((key, list(series)) for key, series in _histograms.items())
+        counters = sorted(_counters.items())
+    lines = []
+    typed = set()
+    for (name, labels), series in histograms:
+        if name not in typed:
+            lines += [f"# HELP {name} {HELP.get(name, name)}", f"# TYPE {name} histogram"]
+            typed.add(name)
+        cumulative = 0
+        for bound, count in zip(list(_buckets(name)) + ["+Inf"], series[:-1]):
+            cumulative += count
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {series[-1]}")
+        lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+    for (name, labels), value in counters:
+        if name not in typed:
+            lines += [f"# HELP {name} {HELP.get(name, name)}", f"# TYPE {name} counter"]
+            typed.add(name)
+        lines.append(f"{name}{_format_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def dump_metrics(path=None):
+    """Atomically write prometheus_text() to path (default: secrets [metrics] dump_path)."""
+    path = path or _setting("dump_path", None)
+    if not path:
+        return
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.NamedTemporaryFile("w", dir=directory, delete=False, suffix=".tmp") as file:
+        file.write(prometheus_text())
+    os.chmod(file.name, 0o644)  # NamedTemporaryFile is owner-only; collectors usually run as another user
+    os.replace(file.name, path)
+
+
+def maybe_dump_metrics():
+    """dump_metrics() at most every `[metrics] dump_interval_seconds`."""
+    global _last_dump
+    now = time.monotonic()
+    if now - _last_dump >= float(_setting("dump_interval_seconds", 15)):
+        _last_dump = now
+        dump_metrics()
+
+
+def render_metrics_panel():
+    """Developer sidebar with page/query latency percentiles, cache hit rates and pool stats."""
+    if not _setting("panel", False):
+        return
+    import pandas as pd
+    import streamlit as st
+    from db_utils import pool_stats
+
+    with st.sidebar.expander("Metrics", expanded=False):
+        for title, name in (("Pages", "stacksight_page_seconds"), ("Render steps", "stacksight_render_seconds"),
+                            ("Queries", "stacksight_query_seconds")):
+            rows = summary(name)
+            if rows:
+                st.caption(title)
+                st.dataframe(pd.DataFrame(rows), hide_index=True, use_container_width=True)
+        with _lock:
+            counters = dict(_counters)
+        caches = sorted({dict(labels)["cache"] for (name, labels) in counters if name == "stacksight_cache_requests_total"})
+        if caches:
+            st.caption("Caches")
+            st.dataframe(pd.DataFrame([{
+                "cache": cache,
+                "requests": counters.get(("stacksight_cache_requests_total", (("cache", cache),)), 0),
+                "misses": counters.get(("stacksight_cache_misses_total", (("cache", cache),)), 0),
+            } for cache in caches]), hide_index=True, use_container_width=True)
+        st.caption("Connection pool")
+        st.json(pool_stats())
+        st.download_button("Prometheus metrics", prometheus_text(), file_name="stacksight.prom", on_click="ignore")
@@ -0,0 +1,120 @@
+"""Versioned schema migrations.
+
+Run `python migrations.py` to apply pending migrations, or
+`python migrations.py --status` to list them. Each migration runs in its own
+transaction and is recorded in schema_migrations. Statements use IF NOT EXISTS
+so databases created before this module existed can be adopted as they are.
+"""
+import argparse
+import sys
+
+from sqlalchemy import text
+
+from db_utils import get_engine
+from rollup_utils import REBUILD_STATEMENTS
+
+
+MIGRATIONS = [
+    (1, "base schema", [
+        """CREATE TABLE IF NOT EXISTS users (
+                uname VARCHAR(50) PRIMARY KEY,
+                pword TEXT NOT NULL,
+                email VARCHAR(255) NOT NULL)""",
+        """CREATE TABLE IF NOT EXISTS company_types (
+                ctype SERIAL PRIMARY KEY,
+                ctype_t VARCHAR(100) NOT NULL UNIQUE)""",
+        """CREATE TABLE IF NOT EXISTS companies (
+                company SERIAL PRIMARY KEY,
+                company_t VARCHAR(100) NOT NULL UNIQUE,
+                ctype INTEGER NOT NULL REFERENCES company_types (ctype),
+                company_link TEXT)""",
+        """CREATE TABLE IF NOT EXISTS financial_plans (
+                plan SERIAL PRIMARY KEY,
+                plan_t VARCHAR(100) NOT NULL UNIQUE)""",
+        """CREATE TABLE IF NOT EXISTS paths (
+                fin_path SERIAL PRIMARY KEY,
+                fin_path_t VARCHAR(100) NOT NULL UNIQUE)""",
+        """CREATE TABLE IF NOT EXISTS accounts (
+                account_num VARCHAR(50) PRIMARY KEY,
+                uname VARCHAR(50) NOT NULL REFERENCES users (uname),
+                company INTEGER NOT NULL REFERENCES companies (company),
+                plan INTEGER NOT NULL REFERENCES financial_plans (plan),
+                fin_path INTEGER NOT NULL REFERENCES paths (fin_path))""",
+        """CREATE TABLE IF NOT EXISTS updates (
+                account_num VARCHAR(50) NOT NULL REFERENCES accounts (account_num),
+                money NUMERIC(10, 2) NOT NULL,
+                begda DATE NOT NULL,
+                PRIMARY KEY (account_num, begda))""",
+    ]),
+    (2, "monthly balance rollup", REBUILD_STATEMENTS),
+    (3, "indexes for page queries", [
+        # every page filters accounts by owner; account_num makes it covering for the account lists
+        "CREATE INDEX IF NOT EXISTS accounts_uname_idx ON accounts (uname, account_num)",
+        # newest-first walk per account (Latest Data, All Data, export) without touching the heap
+        "CREATE INDEX IF NOT EXISTS updates_account_begda_desc_idx ON updates (account_num, begda DESC) INCLUDE (money)",
+        "CREATE INDEX IF NOT EXISTS companies_ctype_idx ON companies (ctype)",
+    ]),
+    (4, "cache version counters", [
+        # one row per table:<name> / user:<name> scope, bumped in the writing transaction (db_utils.bump_versions)
+        """CREATE TABLE IF NOT EXISTS cache_versions (
+                scope TEXT PRIMARY KEY,
+                version BIGINT NOT NULL)""",
+    ]),
+    (5, "session token revocation", [
+        # signed into every session token; logout increments it (auth_utils.revoke_tokens)
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS token_generation INTEGER NOT NULL DEFAULT 0",
+    ]),
+]
+
+_CREATE_TABLE = """CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    applied_at TIMESTAMPTZ NOT NULL DEFAULT now())"""
+
+
+def applied_versions(engine=None):
+    engine = engine or get_engine()
+    with engine.begin() as conn:
+        conn.execute(text(_CREATE_TABLE))
+        return {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+
+
+def migrate(engine=None):
+    """Apply pending migrations in order; returns the versions applied."""
+    engine = engine or get_engine()
+    applied = []
+    for version, name, statements in MIGRATIONS:
+        with engine.begin() as conn:
+            conn.execute(text(_CREATE_TABLE))
+            # one migrator at a time; re-check under the lock
+            conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('schema_migrations'))"))
+            done = conn.execute(text("SELECT 1 FROM schema_migrations WHERE version = :version"),
+                                {"version": version}).first()
+            if done:
+                continue
+            for statement in statements:
+                conn.execute(text(statement))
+            conn.execute(text("INSERT INTO schema_migrations (version, name) VALUES (:version, :name)"),
+                         {"version": version, "name": name})
+        applied.append(version)
+    return applied
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Apply StackSight schema migrations.")
+    parser.add_argument("--status", action="store_true", help="list migrations without applying them")
+    args = parser.parse_args(argv)
+
+    if args.status:
+        done = applied_versions()
+        for version, name, _ in MIGRATIONS:
+            print(f"{version:>4}  {'applied' if version in done else 'pending':<8} {name}")
+        return 0
+
+    applied = migrate()
+    print(f"Applied migrations: {', '.join(map(str, applied))}" if applied else "Schema is up to date.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
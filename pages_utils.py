@@ -1,4 +1,5 @@
 import streamlit as st
+from auth_utils import revoke_tokens
 def goto_page(page_name): #change page function
     st.session_state.page = page_name
 
@@ -6,4 +7,13 @@ def goto_page_if_logged_in(page_name):
     if "username" in st.session_state and st.session_state.username != "Guest":
         goto_page(page_name)
     else:
-        st.error("Please log in to access this page.")
\ No newline at end of file
+        st.error("Please log in to access this page.")
+
+def logout(): #forget the user and revoke their session tokens, including copies of the URL
+    revoke_tokens(st.session_state.username)
+    st.session_state.username = "Guest"
+    st.query_params.pop("session", None)
+    goto_page("Home")
+
+def set_page_cursor(cursor): #move the paginated table to another page
+    st.session_state.page_cursor = cursor
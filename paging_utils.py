@@ -0,0 +1,107 @@
+"""Keyset pagination over (account_num, begda) for the "All Data" table."""
+
+from cache_utils import memoize
+from db_utils import read_query_arrow, return_run_query, data_version, submit_query
+from metrics_utils import cache_request, cache_miss
+
+
+PAGE_SIZES = [25, 50, 100, 250]
+
+# low-cardinality text columns of a page, dictionary-encoded
+DIMENSION_COLUMNS = ("Account Number", "Company", "Company Type", "Plan", "Path")
+
+PAGE_QUERY = """SELECT accounts.account_num "Account Number",
+                    companies.company_t "Company",
+                    company_types.ctype_t "Company Type",
+                    financial_plans.plan_t "Plan",
+                    paths.fin_path_t "Path",
+                    updates.money "Amount Of Money",
+                    updates.begda "Last Updated"
+                    FROM accounts
+                    INNER JOIN companies ON accounts.company = companies.company
+                    INNER JOIN company_types ON companies.ctype = company_types.ctype
+                    INNER JOIN financial_plans ON accounts.plan = financial_plans.plan
+                    INNER JOIN paths ON accounts.fin_path = paths.fin_path
+                    INNER JOIN updates ON accounts.account_num = updates.account_num
+                    WHERE accounts.uname = :username
+                    AND accounts.account_num IN :accounts
+                    {keyset}
+                    ORDER BY updates.account_num {account_order}, updates.begda {begda_order}
+                    LIMIT :limit"""
+
+# rows strictly after / before a key in (account_num ASC, begda DESC) order
+_AFTER = """AND (updates.account_num > :key_account
+                    OR (updates.account_num = :key_account AND updates.begda < :key_begda))"""
+_BEFORE = """AND (updates.account_num < :key_account
+                    OR (updates.account_num = :key_account AND updates.begda > :key_begda))"""
+
+# the selected accounts come from the user's own list and PAGE_QUERY re-checks ownership, so the
+# estimate leaves out accounts.uname: the planner would multiply the two selectivities and undercount
+COUNT_PLAN = """EXPLAIN (FORMAT JSON)
+                    SELECT 1 FROM updates
+                    WHERE updates.account_num IN :accounts"""
+
+
+def page_query(direction=None):
+    """PAGE_QUERY for the first page (None), or the page "after" / "before" a key."""
+    if direction == "before":
+        return PAGE_QUERY.format(keyset=_BEFORE, account_order="DESC", begda_order="ASC")
+    return PAGE_QUERY.format(keyset=_AFTER if direction == "after" else "", account_order="ASC", begda_order="DESC")
+
+
+def fetch_page(username, accounts, page_size, cursor=None):
+    """One page of history in (account_num, begda DESC) order, as a pyarrow Table.
+
+    cursor is None for the first page, ("after", key) for the page following
+    key, or ("before", key) for the page preceding it, where key is an
+    (account_num, begda) pair. Returns (table, has_prev, has_next).
+    """
+    params = {"username": username, "accounts": list(accounts), "limit": page_size + 1}
+    direction = cursor[0] if cursor else None
+    if cursor:
+        params["key_account"], params["key_begda"] = cursor[1]
+
+    table = read_query_arrow(page_query(direction), params=params, dictionary_columns=DIMENSION_COLUMNS)
+    more = table.num_rows > page_size
+    table = table.slice(0, page_size)
+
+    if direction == "before":
+        return table.take(list(range(table.num_rows - 1, -1, -1))), more, True
+    return table, direction == "after", more
+
+
+def page_keys(table):
+    """(first, last) keys of a page, used as cursors for the neighbouring pages."""
+    accounts, dates = table.column("Account Number"), table.column("Last Updated")
+    last = table.num_rows - 1
+    return (accounts[0].as_py(), dates[0].as_py()), (accounts[last].as_py(), dates[last].as_py())
+
+
+@memoize("row_count")
+def _approx_row_count(username, version, accounts):
+    cache_miss("row_count")
+    plan = return_run_query(query_str=COUNT_PLAN, params={"accounts": list(accounts)})[0][0]
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def approx_row_count(username, accounts):
+    """Planner estimate of the row count; no scan of the history is needed."""
+    cache_request("row_count")
+    return _approx_row_count(username, data_version(username), tuple(accounts))
+
+
+def prefetch_page(request):
+    """Start fetching a page in the background; request is fetch_page's arguments as a tuple."""
+    return submit_query(fetch_page, *request)
+
+
+def get_page(request, prefetched=None):
+    """fetch_page(*request), reusing a matching background prefetch if there is one."""
+    future = (prefetched or {}).get(request)
+    # a prefetch still queued behind other speculative work is cancelled and fetched here instead
+    if future is not None and not future.cancel():
+        try:
+            return future.result()
+        except Exception:
+            pass  # fall back to a fresh fetch below
+    return fetch_page(*request)
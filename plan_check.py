@@ -0,0 +1,112 @@
+"""Query-plan regression check for every page query.
+
+Runs EXPLAIN (FORMAT JSON) for each query the app issues against a scratch
+PostgreSQL database and fails if a plan sequentially scans or sorts a large
+table. An empty database is migrated and filled with benchmarks.synthetic
+data first:
+
+    python plan_check.py postgresql+psycopg2://postgres@localhost/stacksight_plans
+"""
+import argparse
+import datetime
+import sys
+
+from sqlalchemy import create_engine, text
+
+import migrations
+from auth_utils import PASSWORD_HASH_QUERY
+from benchmarks import synthetic
+from dataset_utils import (ACCOUNTS_QUERY, ACCOUNT_INFO_QUERY, DATASET_QUERY, FIRST_ACCOUNT_INFO_QUERY,
+                           LATEST_ALL_QUERY, LATEST_QUERY)
+from db_utils import prepare_query
+from export_utils import EXPORT_QUERY
+from paging_utils import COUNT_PLAN, page_query
+from rollup_utils import CHART_ALL_QUERY, CHART_QUERY, OPTIONS_QUERY
+
+
+# tables that grow with the number of users or months of history
+LARGE_TABLES = {"users", "accounts", "updates", "balance_rollup"}
+# sorts of up to this many estimated rows are fine (a page, or one user's accounts)
+SORT_ROW_LIMIT = 1000
+
+def page_queries():
+    """(name, sql, params) for every query the pages issue, with params for user_1."""
+    user = "user_1"
+    accounts = ["ACC-1-1", "ACC-1-2", "ACC-1-3"]
+    key = {"key_account": "ACC-1-2", "key_begda": datetime.date(2018, 6, 1)}
+    return [
+        ("Login lookup", PASSWORD_HASH_QUERY, {"username": user}),
+        ("Account list", ACCOUNTS_QUERY, {"username": user}),
+        ("Account info", ACCOUNT_INFO_QUERY, {"account_num": accounts[0]}),
+        ("First account info", FIRST_ACCOUNT_INFO_QUERY, {"username": user}),
+        ("Chart filter options", OPTIONS_QUERY, {"username": user, "dimension": "company_t"}),
+        ("Separated/Combined", CHART_QUERY, {"username": user, "dimension": "account_num", "selected": accounts}),
+        ("Separated/Combined (all values)", CHART_ALL_QUERY, {"username": user, "dimension": "company_t"}),
+        ("Latest Data", LATEST_QUERY, {"username": user, "accounts": accounts}),
+        ("Latest Data (all accounts)", LATEST_ALL_QUERY, {"username": user}),
+        ("All Data (first page)", page_query(), {"username": user, "accounts": accounts, "limit": 51}),
+        ("All Data (next page)", page_query("after"), {"username": user, "accounts": accounts, "limit": 51, **key}),
+        ("All Data (previous page)", page_query("before"), {"username": user, "accounts": accounts, "limit": 51, **key}),
+        ("All Data (row estimate)", COUNT_PLAN.replace("EXPLAIN (FORMAT JSON)", ""), {"accounts": accounts}),
+        ("Export", EXPORT_QUERY, {"username": user, "accounts": accounts}),
+        ("User dataset", DATASET_QUERY, {"username": user}),
+    ]
+
+
+def plan_problems(plan):
+    """Sequential scans or large sorts on LARGE_TABLES anywhere in a plan tree."""
+    problems = []
+    nodes = [plan]
+    while nodes:
+        node = nodes.pop()
+        nodes.extend(node.get("Plans", []))
+        if node["Node Type"] == "Seq Scan" and node.get("Relation Name") in LARGE_TABLES:
+            problems.append(f"Seq Scan on {node['Relation Name']} (~{node['Plan Rows']} rows)")
+        if node["Node Type"] in ("Sort", "Incremental Sort") and node["Plan Rows"] > SORT_ROW_LIMIT:
+            problems.append(f"{node['Node Type']} of ~{node['Plan Rows']} rows")
+    return problems
+
+
+def seed(engine, users, accounts, months):
+    """Fill an empty database with synthetic data; returns False if it already has users."""
+    with engine.connect() as conn:
+        if conn.execute(text("SELECT count(*) FROM users")).scalar():
+            return False
+    synthetic.load(engine, synthetic.generate(users, accounts, months))
+    return True
+
+
+def check(engine):
+    """Print every plan verdict; returns the number of failing queries."""
+    failures = 0
+    with engine.connect() as conn:
+        for name, query_str, params in page_queries():
+            query, params = prepare_query(f"EXPLAIN (FORMAT JSON) {query_str}", params)
+            plan = conn.execute(query, params).scalar()[0]["Plan"]
+            problems = plan_problems(plan)
+            failures += bool(problems)
+            print(f"{'FAIL' if problems else 'ok':<5} {name}: {'; '.join(problems) or 'index-backed'}")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fail on sequential scans or large sorts in page query plans.")
+    parser.add_argument("url", help="SQLAlchemy URL of a scratch PostgreSQL database")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--accounts", type=int, default=5, help="accounts per user")
+    parser.add_argument("--months", type=int, default=60, help="months of updates per account")
+    args = parser.parse_args(argv)
+
+    engine = create_engine(args.url)
+    migrations.migrate(engine)
+    if seed(engine, args.users, args.accounts, args.months):
+        print(f"Seeded {args.users} users x {args.accounts} accounts x {args.months} months.")
+
+    failures = check(engine)
+    print(f"{failures} of {len(page_queries())} page queries have plan regressions." if failures
+          else "All page query plans are index-backed.")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
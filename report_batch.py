@@ -0,0 +1,202 @@
+"""Headless monthly statements: latest balances, per-dimension totals and a balance chart per user.
+
+Users are split into shards that a process pool renders in parallel. Each
+worker holds a single pooled connection and reads through the same cached
+functions the Tables and Charts pages use. Every finished user directory
+gets a DONE marker, so a rerun after a partial failure skips the users
+that already have one.
+
+Run it from the app directory so .streamlit/secrets.toml points at the
+database:
+
+    python report_batch.py --out statements/2026-10 --workers 4
+
+The chart is a PNG if kaleido is installed, and an interactive HTML file
+otherwise. The HTML charts load plotly.js from a single copy written to the
+output directory, so the statements open offline; move the directory as a
+whole.
+"""
+import argparse
+import datetime
+import importlib.util
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from urllib.parse import quote
+
+
+USERS_QUERY = "SELECT uname FROM users ORDER BY uname"
+
+DONE_MARKER = "DONE"
+SHARD_SIZE = 50  # users per task; small enough to spread the tail evenly over the workers
+
+# latest_balances column per FILTER_DICT label
+TOTAL_COLUMNS = {"Account Number": "Account Number",
+                 "Company": "Company",
+                 "Company Type": "Company Type",
+                 "Financial Plan": "Plan",
+                 "Financial Path": "Path"}
+
+CHART_HTML = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><script src="{plotly_js}"></script></head>
+<body><div id="chart"></div><script>
+var figure = {figure};
+Plotly.newPlot("chart", figure.data, figure.layout);
+</script></body></html>
+"""
+
+
+def user_dir(out, username):
+    return os.path.join(out, quote(username, safe=""))
+
+
+def pending_users(out, users, force=False):
+    """Users without a DONE marker in out (all of them with force)."""
+    return [user for user in users if force or not os.path.exists(os.path.join(user_dir(out, user), DONE_MARKER))]
+
+
+def dimension_totals(latest):
+    """Sum of latest balances per value of every FILTER_DICT dimension, with each value's share."""
+    long = latest.melt(id_vars="Amount Of Money", value_vars=list(TOTAL_COLUMNS.values()),
+                       var_name="Dimension", value_name="Value")
+    totals = long.groupby(["Dimension", "Value"], sort=False)["Amount Of Money"].sum().reset_index()
+    totals["Dimension"] = totals["Dimension"].map({column: label for label, column in TOTAL_COLUMNS.items()})
+    total = latest["Amount Of Money"].sum()
+    totals["Share"] = totals["Amount Of Money"] / total if total else float("nan")
+    return totals
+
+
+def plotly_js_name():
+    from plotly.offline import get_plotlyjs_version
+
+    return f"plotly-{get_plotlyjs_version()}.min.js"
+
+
+def write_plotly_js(out):
+    """Write the plotly.js bundle the HTML charts load into out, unless a run already has."""
+    path = os.path.join(out, plotly_js_name())
+    if not os.path.exists(path):
+        from plotly.offline import get_plotlyjs
+
+        os.makedirs(out, exist_ok=True)
+        partial = f"{path}.{os.getpid()}.tmp"
+        with open(partial, "w", encoding="utf-8") as file:
+            file.write(get_plotlyjs())
+        os.replace(partial, path)  # an interrupted run never leaves a truncated bundle behind
+    return path
+
+
+def write_chart(figure_json, path, plotly_js):
+    """Write a figure as path.png with kaleido, else as path.html; returns the file written.
+
+    plotly_js is the URL of the plotly.js bundle, relative to the HTML file.
+    The figure JSON comes from chart_utils, already validated, so it is
+    written as is rather than rebuilt into a plotly Figure.
+    """
+    if importlib.util.find_spec("kaleido") is not None:
+        import plotly.io as pio
+
+        try:
+            pio.write_image(json.loads(figure_json), f"{path}.png", width=1000, height=500, validate=False)
+            return f"{path}.png"
+        except (ValueError, RuntimeError, OSError):  # kaleido present but unable to render (e.g. no browser)
+            pass
+    with open(f"{path}.html", "w", encoding="utf-8") as file:
+        # "</" would end the script element early if a label contained "</script>"
+        file.write(CHART_HTML.format(plotly_js=plotly_js, figure=figure_json.replace("</", "<\\/")))
+    return f"{path}.html"
+
+
+def render_statement(out, username):
+    """Write one user's statement files, then the DONE marker."""
+    from chart_utils import chart_figure
+    from dataset_utils import latest_balances
+
+    directory = user_dir(out, username)
+    os.makedirs(directory, exist_ok=True)
+    marker = os.path.join(directory, DONE_MARKER)
+    if os.path.exists(marker):  # an earlier, interrupted run may have rendered it already
+        os.remove(marker)
+
+    latest = latest_balances(username)
+    latest.to_csv(os.path.join(directory, "latest_balances.csv"), index=False)
+    dimension_totals(latest).to_csv(os.path.join(directory, "dimension_totals.csv"), index=False)
+    write_chart(chart_figure(username, "Combined", "account_num", "Account Number"), os.path.join(directory, "balance"),
+                f"../{plotly_js_name()}")
+
+    with open(marker, "w") as file:
+        file.write(datetime.datetime.now().isoformat(timespec="seconds") + "\n")
+
+
+def _init_worker():
+    from db_utils import set_pool_options
+
+    # shards run one user at a time, so one connection per worker is enough
+    set_pool_options(pool_size=1, max_overflow=0)
+
+
+def render_shard(out, users):
+    """Render a shard; returns (rendered users, [(user, error)]) so one bad user does not fail the shard."""
+    rendered, failed = [], []
+    for username in users:
+        try:
+            render_statement(out, username)
+            rendered.append(username)
+        except Exception as error:
+            failed.append((username, f"{type(error).__name__}: {error}"))
+    return rendered, failed
+
+
+def shards(users, size):
+    return [users[i:i + size] for i in range(0, len(users), size)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render monthly statements for every user.")
+    parser.add_argument("--out", default=os.path.join("statements", datetime.date.today().strftime("%Y-%m")),
+                        help="output directory, one subdirectory per user")
+    parser.add_argument("--users", nargs="+", help="only these users (default: every user)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("--shard-size", type=int, default=SHARD_SIZE, help="users per task")
+    parser.add_argument("--force", action="store_true", help="re-render users that already have a DONE marker")
+    args = parser.parse_args(argv)
+
+    from db_utils import return_run_query
+
+    users = args.users or [row[0] for row in return_run_query(query_str=USERS_QUERY)]
+    todo = pending_users(args.out, users, args.force)
+    print(f"{len(users) - len(todo)} of {len(users)} users already done, rendering {len(todo)} "
+          f"in {len(shards(todo, args.shard_size))} shards on {args.workers} workers")
+
+    if todo:
+        write_plotly_js(args.out)
+
+    start = time.perf_counter()
+    rendered, failed = 0, []
+    with ProcessPoolExecutor(args.workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_worker) as pool:
+        futures = {pool.submit(render_shard, args.out, shard): shard for shard in shards(todo, args.shard_size)}
+        for future in as_completed(futures):
+            try:
+                done, errors = future.result()
+            except Exception as error:  # the worker died; the whole shard is retried on the next run
+                done, errors = [], [(user, f"{type(error).__name__}: {error}") for user in futures[future]]
+            rendered += len(done)
+            failed += errors
+            elapsed = time.perf_counter() - start
+            print(f"{rendered:>7,} rendered  {len(failed):>5,} failed  {rendered / elapsed:7.1f} reports/s")
+
+    elapsed = time.perf_counter() - start
+    print(f"Rendered {rendered:,} statements in {elapsed:.1f}s ({rendered / elapsed if elapsed else 0.0:.1f} reports/s)")
+    for username, error in failed:
+        print(f"FAILED {username}: {error}")
+    if failed:
+        print("Rerun the same command to retry the failed users.")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
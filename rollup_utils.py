@@ -0,0 +1,210 @@
+"""Monthly balance rollup per (user, dimension, dimension value, month).
+
+The rollup is maintained incrementally by record_balance and read by the
+Charts page. Run `python rollup_utils.py rebuild` once to create and backfill
+it, and `python rollup_utils.py verify` to diff it against `updates`.
+"""
+import argparse
+import sys
+
+import pandas as pd
+
+from cache_utils import memoize
+from db_utils import read_query_df, return_run_query, run_queries, data_version
+from metrics_utils import cache_request, cache_miss
+
+
+ROLLUP_DDL = """CREATE TABLE IF NOT EXISTS balance_rollup (
+                    uname TEXT NOT NULL,
+                    dimension TEXT NOT NULL,
+                    dim_value TEXT NOT NULL,
+                    month DATE NOT NULL,
+                    money NUMERIC NOT NULL,
+                    PRIMARY KEY (uname, dimension, dim_value, month))"""
+
+# one row per rollup dimension for every account; the dimension names match dataset_utils.FILTER_DICT values
+_ACCOUNT_DIMENSIONS = """FROM accounts
+                    INNER JOIN companies ON accounts.company = companies.company
+                    INNER JOIN financial_plans ON accounts.plan = financial_plans.plan
+                    INNER JOIN paths ON accounts.fin_path = paths.fin_path
+                    INNER JOIN company_types ON companies.ctype = company_types.ctype
+                    CROSS JOIN LATERAL (VALUES ('account_num', CAST(accounts.account_num AS TEXT)),
+                                               ('company_t', companies.company_t),
+                                               ('ctype_t', company_types.ctype_t),
+                                               ('plan_t', financial_plans.plan_t),
+                                               ('fin_path_t', paths.fin_path_t)) AS dims(dimension, dim_value)"""
+
+_APPLY_DELTA = f"""INSERT INTO balance_rollup (uname, dimension, dim_value, month, money)
+                    SELECT accounts.uname, dims.dimension, dims.dim_value,
+                           CAST(date_trunc('month', CAST(:begda AS DATE)) AS DATE),
+                           :money - coalesce((SELECT money FROM updates
+                                              WHERE updates.account_num = :account_num
+                                              AND updates.begda = :begda), 0)
+                    {_ACCOUNT_DIMENSIONS}
+                    WHERE accounts.account_num = :account_num
+                    ON CONFLICT (uname, dimension, dim_value, month) DO UPDATE
+                    SET money = balance_rollup.money + EXCLUDED.money"""
+
+OPTIONS_QUERY = """SELECT dim_value FROM balance_rollup
+                    WHERE uname = :username AND dimension = :dimension
+                    GROUP BY dim_value ORDER BY dim_value"""
+
+_CHART = """SELECT dim_value, money, month FROM balance_rollup
+                    WHERE uname = :username AND dimension = :dimension
+                    {value_filter}
+                    ORDER BY month"""
+
+CHART_QUERY = _CHART.format(value_filter="AND dim_value IN :selected")
+# every value of the dimension, the Charts page default; needs no options lookup first
+CHART_ALL_QUERY = _CHART.format(value_filter="")
+
+_UPSERT_UPDATE = """INSERT INTO updates (account_num, money, begda)
+                    VALUES (:account_num, :money, :begda)
+                    ON CONFLICT (account_num, begda) DO UPDATE
+                    SET money = EXCLUDED.money"""
+
+_FRESH_ROLLUP = f"""SELECT accounts.uname, dims.dimension, dims.dim_value,
+                           CAST(date_trunc('month', updates.begda) AS DATE) AS month,
+                           sum(updates.money) AS money
+                    {_ACCOUNT_DIMENSIONS}
+                    INNER JOIN updates ON accounts.account_num = updates.account_num
+                    GROUP BY accounts.uname, dims.dimension, dims.dim_value, 4"""
+
+
+def staged_delta_query(staging_table):
+    """Apply the deltas of every staged (account_num, money, begda) row that the user owns.
+
+    Must run in the transaction that merges the staging table into `updates`,
+    before the merge and after lock_accounts_query.
+    """
+    return f"""INSERT INTO balance_rollup (uname, dimension, dim_value, month, money)
+                    SELECT accounts.uname, dims.dimension, dims.dim_value,
+                           CAST(date_trunc('month', staged.begda) AS DATE),
+                           sum(staged.money - coalesce(updates.money, 0))
+                    {_ACCOUNT_DIMENSIONS}
+                    INNER JOIN {staging_table} AS staged ON staged.account_num = accounts.account_num
+                    LEFT JOIN updates ON updates.account_num = staged.account_num
+                                     AND updates.begda = staged.begda
+                    WHERE accounts.uname = :username
+                    GROUP BY 1, 2, 3, 4
+                    ON CONFLICT (uname, dimension, dim_value, month) DO UPDATE
+                    SET money = balance_rollup.money + EXCLUDED.money"""
+
+
+def lock_accounts_query(staging_table):
+    """Take record_balance's per-account locks for every staged account, in a fixed order."""
+    return f"""SELECT pg_advisory_xact_lock(hashtext(CAST(account_num AS TEXT)))
+                    FROM (SELECT DISTINCT account_num FROM {staging_table} ORDER BY 1) AS staged"""
+
+
+def balance_statements(account_num, money, begda):
+    """(query_str, params) statements record_balance runs in one transaction."""
+    params = {"account_num": account_num, "money": money, "begda": begda}
+    return [
+        # serialize writers of the same account so the old value read below stays valid
+        ("SELECT pg_advisory_xact_lock(hashtext(CAST(:account_num AS TEXT)))", {"account_num": account_num}),
+        (_APPLY_DELTA, params),
+        (_UPSERT_UPDATE, params),
+    ]
+
+
+def record_balance(username, account_num, money, begda):
+    """Upsert a monthly balance and apply its delta to the rollup in one transaction."""
+    run_queries(balance_statements(account_num, money, begda), username=username)
+
+
+@memoize("rollup_options")
+def _rollup_options(username, version, dimension):
+    cache_miss("rollup_options")
+    rows = return_run_query(query_str=OPTIONS_QUERY, params={"username": username, "dimension": dimension})
+    return [row[0] for row in rows]
+
+
+@memoize("rollup_frame")
+def _rollup_frame(username, version, dimension, selected):
+    cache_miss("rollup_frame")
+    if selected is None:
+        df = read_query_df(CHART_ALL_QUERY, params={"username": username, "dimension": dimension})
+    else:
+        df = read_query_df(CHART_QUERY, params={"username": username, "dimension": dimension, "selected": list(selected)})
+    df["month"] = pd.to_datetime(df["month"])
+    return df
+
+
+def rollup_options(username, dimension):
+    """Dimension values the user has balances for."""
+    cache_request("rollup_options")
+    return _rollup_options(username, data_version(username), dimension)
+
+
+def _selection_key(selected):
+    return None if selected is None else tuple(str(value) for value in selected)
+
+
+def rollup_separated(username, dimension, label, selected=None):
+    """Monthly totals per selected dimension value (all values if None), shaped for the Separated chart."""
+    cache_request("rollup_frame")
+    df = _rollup_frame(username, data_version(username), dimension, _selection_key(selected))
+    return df.rename(columns={"dim_value": label, "money": "Amount Of Money", "month": "Date"})
+
+
+def rollup_combined(username, dimension, selected=None):
+    """Monthly totals over all selected dimension values (all values if None), shaped for the Combined chart."""
+    cache_request("rollup_frame")
+    df = _rollup_frame(username, data_version(username), dimension, _selection_key(selected))
+    df = df.groupby("month", as_index=False)["money"].sum()
+    return df.rename(columns={"money": "Amount Of Money", "month": "Date"})[["Amount Of Money", "Date"]]
+
+
+REBUILD_STATEMENTS = [
+    ROLLUP_DDL,
+    "LOCK TABLE balance_rollup IN EXCLUSIVE MODE",
+    "DELETE FROM balance_rollup",
+    f"INSERT INTO balance_rollup (uname, dimension, dim_value, month, money) {_FRESH_ROLLUP}",
+]
+
+
+def rebuild_rollup():
+    """Recompute the whole rollup from `updates`."""
+    run_queries([(statement, None) for statement in REBUILD_STATEMENTS])
+
+
+def verify_rollup():
+    """Rows where the live rollup differs from a fresh computation."""
+    return read_query_df(f"""WITH fresh AS ({_FRESH_ROLLUP})
+                        SELECT coalesce(live.uname, fresh.uname) AS uname,
+                               coalesce(live.dimension, fresh.dimension) AS dimension,
+                               coalesce(live.dim_value, fresh.dim_value) AS dim_value,
+                               coalesce(live.month, fresh.month) AS month,
+                               live.money AS live_money,
+                               fresh.money AS fresh_money
+                        FROM balance_rollup AS live
+                        FULL OUTER JOIN fresh
+                          ON live.uname = fresh.uname AND live.dimension = fresh.dimension
+                          AND live.dim_value = fresh.dim_value AND live.month = fresh.month
+                        WHERE live.money IS DISTINCT FROM fresh.money
+                          AND NOT (fresh.money IS NULL AND live.money = 0)
+                        ORDER BY 1, 2, 3, 4""")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the monthly balance rollup.")
+    parser.add_argument("command", choices=["rebuild", "verify"])
+    args = parser.parse_args(argv)
+
+    if args.command == "rebuild":
+        rebuild_rollup()
+        print("Rollup rebuilt.")
+        return 0
+
+    diff = verify_rollup()
+    if diff.empty:
+        print("Rollup matches updates.")
+        return 0
+    print(diff.to_string(index=False))
+    print(f"{len(diff)} rollup rows differ from updates.")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""Cold-start and rerun budget check for every page.
+
+For each page, in a fresh interpreter:
+  * import time of the app shell (what main.py imports) and of the page's
+    module, broken down by top-level package (python -X importtime), and
+  * first-render latency (cold: imports, engine, first queries, cache fills)
+    and warm-rerun latency, by rendering main.py with Streamlit's AppTest.
+
+Run it from the app directory so .streamlit/secrets.toml points at a
+database with data for --user:
+
+    python startup_profile.py --user user_1 --render-budget-ms 3000 --rerun-budget-ms 300
+"""
+import argparse
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+from views import PAGES
+
+
+APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+SHELL_IMPORTS = "import streamlit, views, auth_utils, metrics_utils"
+
+# session state that puts each page into its heaviest common view
+PAGE_STATE = {"Charts": {"chart": "Separated"},
+              "Tables": {"table": "Latest Data"},
+              "Insert": {"form": "Update Account Form"}}
+
+
+def import_breakdown(statement):
+    """Total import seconds of a statement in a fresh interpreter, and self time per top-level package."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", statement], capture_output=True, text=True,
+                            cwd=os.path.dirname(APP))
+    packages = defaultdict(float)
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        packages[name.strip().split(".")[0]] += int(self_us) / 1e6
+    return sum(packages.values()), dict(packages)
+
+
+def _render(page, user):
+    from streamlit.testing.v1 import AppTest
+
+    def run(at):
+        start = time.perf_counter()
+        at.run()
+        if at.exception:
+            raise RuntimeError(f"{page} raised: {at.exception[0].message}")
+        return time.perf_counter() - start
+
+    at = AppTest.from_file(APP, default_timeout=120)
+    at.session_state["page"] = page
+    at.session_state["username"] = user
+    for key, value in PAGE_STATE.get(page, {}).items():
+        at.session_state[key] = value
+    return run(at), run(at)
+
+
+def render_latency(page, user):
+    """(first render, warm rerun) seconds of a page, in a fresh process."""
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        return pool.apply(_render, (page, user))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Profile cold-start imports and first-render latency per page.")
+    parser.add_argument("--user", default="Guest", help="username to render the logged-in pages as")
+    parser.add_argument("--pages", nargs="+", choices=list(PAGES), default=list(PAGES))
+    parser.add_argument("--top", type=int, default=5, help="packages to list per import breakdown")
+    parser.add_argument("--import-budget-ms", type=float, help="fail if the shell plus a page module imports slower")
+    parser.add_argument("--render-budget-ms", type=float, help="fail if a first render is slower")
+    parser.add_argument("--rerun-budget-ms", type=float, help="fail if a warm rerun is slower")
+    args = parser.parse_args(argv)
+
+    over = []
+    shell, packages = import_breakdown(SHELL_IMPORTS)
+    heaviest = sorted(packages.items(), key=lambda item: -item[1])[:args.top]
+    print(f"app shell imports {shell * 1000:7.1f}ms  " + ", ".join(f"{name} {s * 1000:.0f}ms" for name, s in heaviest))
+
+    for page in args.pages:
+        total, packages = import_breakdown(f"{SHELL_IMPORTS}, views.{PAGES[page]}")
+        heaviest = sorted(((name, s) for name, s in packages.items()), key=lambda item: -item[1])[:args.top]
+        first, rerun = render_latency(page, args.user)
+        print(f"{page:<7} imports {total * 1000:7.1f}ms  first render {first * 1000:7.1f}ms  "
+              f"rerun {rerun * 1000:6.1f}ms  | " + ", ".join(f"{name} {s * 1000:.0f}ms" for name, s in heaviest))
+        for label, value, budget in (("imports", total, args.import_budget_ms),
+                                     ("first render", first, args.render_budget_ms),
+                                     ("rerun", rerun, args.rerun_budget_ms)):
+            if budget is not None and value * 1000 > budget:
+                over.append(f"{page} {label} {value * 1000:.0f}ms > {budget:.0f}ms")
+
+    for problem in over:
+        print(f"OVER BUDGET {problem}")
+    return 1 if over else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,35 @@
+"""One module per page, imported the first time this process shows that page.
+
+A cold start then only pays for the imports of the page it renders (Home
+needs neither pandas, plotly nor SQLAlchemy), and later reruns reuse the
+imported module.
+"""
+import importlib
+import sys
+import time
+
+from metrics_utils import observe
+
+
+# st.session_state.page -> module in this package
+PAGES = {"Home": "home",
+         "Login": "login",
+         "Signup": "signup",
+         "Charts": "charts",
+         "Tables": "tables",
+         "Insert": "insert"}
+
+
+def load(page):
+    """The page's module, importing (and timing) it on first use."""
+    name = f"{__name__}.{PAGES[page]}"
+    module = sys.modules.get(name)
+    if module is None:
+        start = time.perf_counter()
+        module = importlib.import_module(name)
+        observe("stacksight_page_import_seconds", time.perf_counter() - start, page=page)
+    return module
+
+
+def render(page):
+    load(page).render()
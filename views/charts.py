@@ -0,0 +1,85 @@
+"""Charts page: Separated, Combined and Analytics charts."""
+import json
+
+import streamlit as st
+
+from analytics_utils import SERIES_METRICS, portfolio_analytics
+from chart_utils import GRANULARITIES, chart_figure, line_figure
+from dataset_utils import FILTER_DICT
+from db_utils import fan_out
+from metrics_utils import timer
+from pages_utils import goto_page
+from rollup_utils import rollup_options
+
+
+def render():
+    st.title("Charts")
+    if st.button("↩ Home"):
+        st.session_state.selected_accounts = []
+        st.session_state.chart = None
+        goto_page("Home")
+        st.rerun()
+    st.divider()
+
+    if "chart" not in st.session_state:  # Initialize chart state
+        st.session_state.chart = None
+
+    if "selected_filters" not in st.session_state:  # Initialize selected filters state
+        st.session_state.selected_filters = []
+
+    if "filter" not in st.session_state:  # Initialize filter state
+        st.session_state.filter = "account_num"
+
+    left, middle, right = st.columns(3)
+
+    if left.button("Separated", use_container_width=True):
+        st.session_state.chart = "Separated"
+        st.session_state.selected_filters = []  # Update selected accounts state
+
+    if middle.button("Combined", use_container_width=True):
+        st.session_state.chart = "Combined"
+        st.session_state.selected_filters = []  # Update selected accounts state
+
+    if right.button("Analytics", use_container_width=True):
+        st.session_state.chart = "Analytics"
+        st.session_state.selected_filters = []
+
+    if st.session_state.chart == "Separated":
+        st.subheader("Separated")
+        st.session_state.filter = st.pills("Filter By", options=list(FILTER_DICT.keys()), default="Account Number")
+        granularity = st.radio("Granularity", list(GRANULARITIES), horizontal=True)
+        dimension = FILTER_DICT[st.session_state.filter]
+        # the options and the default chart (every value selected) run concurrently
+        filter_options, figure = fan_out((rollup_options, st.session_state.username, dimension),
+                                         (chart_figure, st.session_state.username, "Separated", dimension, st.session_state.filter, None, granularity))
+        st.session_state.selected_filters = st.multiselect(f"Select {st.session_state.filter}", filter_options, default=filter_options)
+        if set(st.session_state.selected_filters) != set(filter_options):
+            figure = chart_figure(st.session_state.username, "Separated", dimension, st.session_state.filter, st.session_state.selected_filters, granularity)
+
+    if st.session_state.chart == "Combined":
+        st.subheader("Combined")
+        st.session_state.filter = st.pills("Filter By", options=list(FILTER_DICT.keys()), default="Account Number")
+        granularity = st.radio("Granularity", list(GRANULARITIES), horizontal=True)
+        dimension = FILTER_DICT[st.session_state.filter]
+        # the options and the default chart (every value selected) run concurrently
+        filter_options, figure = fan_out((rollup_options, st.session_state.username, dimension),
+                                         (chart_figure, st.session_state.username, "Combined", dimension, st.session_state.filter, None, granularity))
+        st.session_state.selected_filters = st.multiselect(f"Select {st.session_state.filter}", filter_options, default=filter_options)
+        if set(st.session_state.selected_filters) != set(filter_options):
+            figure = chart_figure(st.session_state.username, "Combined", dimension, st.session_state.filter, st.session_state.selected_filters, granularity)
+
+    if st.session_state.chart == "Analytics":
+        st.subheader("Analytics")
+        st.session_state.filter = st.pills("Filter By", options=list(FILTER_DICT.keys()), default="Account Number")
+        metric = st.radio("Metric", SERIES_METRICS, horizontal=True)
+        series = portfolio_analytics(st.session_state.username, FILTER_DICT[st.session_state.filter], st.session_state.filter).series
+        filter_options = series[st.session_state.filter].unique().tolist()
+        st.session_state.selected_filters = st.multiselect(f"Select {st.session_state.filter}", filter_options, default=filter_options)
+        series = series[series[st.session_state.filter].isin(st.session_state.selected_filters)]
+        figure = line_figure(series, metric, color=st.session_state.filter)
+
+    try:
+        with timer("stacksight_render_seconds", step="st.plotly_chart"):
+            st.plotly_chart(json.loads(figure), use_container_width=True)
+    except NameError:
+        st.info("Please select a chart to display data.")
@@ -0,0 +1,22 @@
+"""Home page: greeting, login/signup and navigation to the app pages."""
+import streamlit as st
+
+from pages_utils import goto_page, goto_page_if_logged_in, logout
+
+
+def render():
+    st.title("Home🏠")
+    col1, col2, col3= st.columns(3)
+    col1.markdown("### Hello "+ st.session_state.username + "!")
+    if st.session_state.username == "Guest":
+        col2.button("Login", on_click= goto_page, args=("Login",),type="primary", use_container_width=True)
+    else:
+        col2.button("Logout", on_click= logout, type="primary", use_container_width=True)
+    col3.button("Sign Up", on_click= goto_page, args=("Signup",),type="primary", use_container_width=True)
+
+    st.divider()
+
+    colA, colB, colC = st.columns(3)
+    colA.button(":green[Charts]", on_click= goto_page_if_logged_in, args=("Charts",), use_container_width=True)
+    colB.button(":blue[Tables]", on_click= goto_page_if_logged_in, args=("Tables",), use_container_width=True)
+    colC.button(":orange[Insert]", on_click= goto_page_if_logged_in, args=("Insert",), use_container_width=True)
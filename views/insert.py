@@ -0,0 +1,126 @@
+"""Insert page: add an account, record a balance or import a balances file."""
+import time
+
+import pandas as pd
+import streamlit as st
+from sqlalchemy.exc import IntegrityError, DataError
+
+from dataset_utils import ACCOUNTS_QUERY, ACCOUNT_INFO_QUERY, FIRST_ACCOUNT_INFO_QUERY
+from db_utils import run_query, return_run_query, fan_out
+from dimension_utils import get_dimension, invalidate_dimensions
+from import_utils import read_upload, parse_balances, import_balances
+from pages_utils import goto_page
+from rollup_utils import record_balance
+
+
+def render():
+    st.title("Insert")
+    if st.button("↩ Home"):
+        st.session_state.form = None
+        goto_page("Home")
+        st.rerun()
+    st.divider()
+    if "form" not in st.session_state:  # Initialize form state
+        st.session_state.form = None
+    left, middle, right = st.columns(3)
+
+    if left.button("Add account", use_container_width=True):
+        st.session_state.form = "Add Account Form"
+    if middle.button("Update account", use_container_width=True):
+        st.session_state.form = "Update Account Form"
+    if right.button("Import file", use_container_width=True):
+        st.session_state.form = "Import File Form"
+    if st.session_state.form == "Add Account Form":
+        with st.form("Add Account Form"):
+            account_num = st.text_input("Account Number")
+            companies = get_dimension("companies")
+            plans = get_dimension("financial_plans")
+            paths = get_dimension("paths")
+            company = st.selectbox("Company", companies.labels)
+            plan = st.selectbox("Financial Plan", plans.labels)
+            fin_path = st.selectbox("Financial Path", paths.labels)
+            submit_button = st.form_submit_button("Add")
+            if submit_button:
+                if account_num == '':
+                    st.error("Please enter an account number.")
+                else:
+                    try:
+                        run_query(query_str="""INSERT INTO accounts (uname, company, account_num, plan, fin_path)
+                                        VALUES (:username, :company, :account_num, :plan, :fin_path)""",
+                           params={"username": st.session_state.username, "company": companies.id_by_label[company], "account_num": account_num,
+                                   "plan": plans.id_by_label[plan], "fin_path": paths.id_by_label[fin_path]},
+                           username=st.session_state.username
+                        )
+                        st.success(f"Account {account_num} added successfully!")
+                        time.sleep(1)
+                        st.session_state.form = None  # Reset form state
+                        st.rerun()
+
+                    except IntegrityError:
+                        invalidate_dimensions()  # a cached id may point at a deleted row
+                        st.error("Account number already exists. Please choose a different account number.")
+                    except DataError:
+                        st.error("Invalid data format. Please check your input.")
+
+
+    # update account form
+    elif st.session_state.form == "Update Account Form":
+        with st.container(border=True):
+            # Fetch accounts for the current user
+            # fetch the accounts together with the details of the likely selection:
+            # last run's account, else the first one (the selectbox default)
+            guess = st.session_state.get("update_account")
+            if guess:
+                accounts, guess_info = fan_out((return_run_query, ACCOUNTS_QUERY, {"username": st.session_state.username}),
+                                               (return_run_query, ACCOUNT_INFO_QUERY, {"account_num": guess}))
+            else:
+                accounts, first = fan_out((return_run_query, ACCOUNTS_QUERY, {"username": st.session_state.username}),
+                                          (return_run_query, FIRST_ACCOUNT_INFO_QUERY, {"username": st.session_state.username}))
+                guess, guess_info = (first[0][0], [first[0][1:]]) if first else (None, [])
+            account_num = st.selectbox("Select Account", [account[0] for account in accounts], key="update_account")
+            if account_num == guess:
+                account_info = guess_info
+            else:
+                account_info = return_run_query(query_str=ACCOUNT_INFO_QUERY, params={"account_num": account_num})
+            st.link_button(f"{account_info[0][0]} | {account_info[0][1]} | {account_info[0][2]}🔗", account_info[0][3])
+            money = st.number_input("Money", step=1000.00, min_value=0.00, max_value=99999999.99)
+            year = st.number_input("Year", step=1, min_value=2000, max_value=pd.Timestamp.now().year, value=pd.Timestamp.now().year)
+            month = st.number_input("Month", step=1, min_value=1, max_value=12, value=pd.Timestamp.now().month)
+            begda = pd.Timestamp(year=year, month=month, day=1)
+            submit_button = st.button("Update")
+            if submit_button:
+                if account_num == '':
+                    st.error("Please select an account.")
+                else:
+                    try:
+                        record_balance(st.session_state.username, account_num, money, begda)
+                        st.success(f"Account {account_num} updated successfully!")
+                        time.sleep(1)
+                        st.session_state.form = None  # Reset form state
+                        st.rerun()
+                    except DataError:
+                        st.error("Invalid data format. Please check your input.")
+
+    # bulk import form
+    elif st.session_state.form == "Import File Form":
+        with st.container(border=True):
+            st.caption("Columns: account number, amount of money, date (one row per account and month).")
+            uploaded_file = st.file_uploader("Balances file", type=["csv", "xlsx"])
+            submit_button = st.button("Import", disabled=uploaded_file is None)
+            if submit_button:
+                accounts = return_run_query(query_str=ACCOUNTS_QUERY,
+                                              params={"username": st.session_state.username})
+                try:
+                    clean, rejects = parse_balances(read_upload(uploaded_file), [account[0] for account in accounts])
+                    if clean.empty:
+                        st.error("No valid rows to import.")
+                    else:
+                        result = import_balances(st.session_state.username, clean)
+                        st.success(f"Imported {result['rows']:,} rows in {result['seconds']:.2f}s ({result['rows_per_sec']:,.0f} rows/sec).")
+                    if not rejects.empty:
+                        st.warning(f"{len(rejects):,} rows were rejected.")
+                        st.dataframe(rejects, hide_index=True, use_container_width=True)
+                except (ValueError, ImportError) as e:
+                    st.error(f"Could not read file: {e}")
+                except DataError:
+                    st.error("Invalid data format. Please check your input.")
@@ -0,0 +1,34 @@
+"""Login page."""
+import time
+
+import streamlit as st
+
+from auth_utils import authenticate, client_address, issue_token, LoginThrottled
+from pages_utils import goto_page
+
+
+def render():
+    st.title("Login")
+    with st.form("Login Form"):
+        username = st.text_input("Username")
+        password = st.text_input("Password", type="password")
+        submit_button = st.form_submit_button("Login")
+        if submit_button:
+            try:
+                if authenticate(username, password, client_address(st.context.headers, st.context.ip_address)):
+                    st.success(f"Welcome {username}!")
+                    st.session_state.username = username
+                    token = issue_token(username)
+                    if token:
+                        st.query_params["session"] = token
+                    time.sleep(1)
+                    goto_page("Home")
+                    st.rerun()
+                else:
+                    st.error("Invalid username or password.")
+            except LoginThrottled as e:
+                st.error(str(e))
+    st.write("Don't have an account?")
+    st.button("Sign Up", on_click= goto_page, args=("Signup",))
+    st.write("Already logged in?")
+    st.button("Home", on_click= goto_page, args=("Home",))
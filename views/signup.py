@@ -0,0 +1,43 @@
+"""Signup page."""
+import time
+
+import streamlit as st
+from sqlalchemy.exc import IntegrityError, DataError
+
+from auth_utils import issue_token
+from db_utils import run_query, hash_password
+from pages_utils import goto_page
+
+
+def render():
+    st.title("Signup")
+    with st.form("Signup Form"):
+        username = st.text_input("Username")
+        password = st.text_input("Password", type="password")
+        email = st.text_input("Email")
+        submit_button = st.form_submit_button("Sign Up")
+        if submit_button:
+            if username == '' or password == '' or email == '':
+                st.error("Please fill in all fields.")
+            else:
+                try:
+                    run_query(query_str="INSERT INTO users (uname, pword, email) VALUES (:username, :password, :email)",
+                              params={"username": username, "password": hash_password(password), "email": email}
+                              )
+                    st.session_state.username = username
+                    token = issue_token(username)
+                    if token:
+                        st.query_params["session"] = token
+                    st.success(f"Account created for {username}!")
+                    time.sleep(1)
+                    goto_page("Home")
+                    st.rerun()
+                except IntegrityError:
+                    st.error("Username already exists. Please choose a different username.")
+                except DataError:
+                    st.error("Invalid data format. Please check your input.")
+
+    st.write("Already have an account?")
+    st.button("Login", on_click= goto_page, args=("Login",))
+    st.write("Already logged in?")
+    st.button("Home", on_click= goto_page, args=("Home",))
@@ -0,0 +1,111 @@
+"""Tables page: Latest Data, paginated All Data, Analytics and history export."""
+from functools import partial
+
+import streamlit as st
+
+from analytics_utils import PERCENT_COLUMNS, portfolio_analytics
+from dataset_utils import ACCOUNTS_QUERY, FILTER_DICT, latest_balances
+from db_utils import return_run_query, fan_out
+from export_utils import EXPORT_FORMATS, ExportFailed, export_to_file, read_export, remove_export
+from metrics_utils import timer
+from pages_utils import goto_page, set_page_cursor
+from paging_utils import PAGE_SIZES, get_page, prefetch_page, page_keys, approx_row_count
+
+
+def render():
+    st.title("Tables")
+    if st.button("↩ Home"):
+        st.session_state.selected_accounts = []
+        st.session_state.table = None
+        goto_page("Home")
+        st.rerun()
+    st.divider()
+
+    if "table" not in st.session_state:  # Initialize table state
+        st.session_state.table = None
+
+    if "selected_accounts" not in st.session_state:  # Initialize selected accounts state
+        st.session_state.selected_accounts = []
+
+    left, middle, right = st.columns(3)
+
+    if left.button("Latest Data", use_container_width=True):
+        st.session_state.table = "Latest Data"
+
+    if middle.button("All Data", use_container_width=True):
+        st.session_state.table = "All Data"
+
+    if right.button("Analytics", use_container_width=True):
+        st.session_state.table = "Analytics"
+
+    # fetch the account list together with the table the selection most likely resolves to
+    if st.session_state.table == "All Data" and st.session_state.get("page_base"):
+        page_request = st.session_state.page_base + (st.session_state.page_cursor,)  # last run's page
+        if page_request not in st.session_state.prefetched:
+            st.session_state.prefetched = {page_request: prefetch_page(page_request)}
+    if st.session_state.table == "Latest Data":
+        accounts_list = fan_out((return_run_query, ACCOUNTS_QUERY, {"username": st.session_state.username}),
+                                (latest_balances, st.session_state.username))[0]  # the default: every account
+    else:
+        accounts_list = return_run_query(query_str=ACCOUNTS_QUERY, params={"username": st.session_state.username})
+    account_options = [account[0] for account in accounts_list]
+
+    if st.session_state.table == "Latest Data":
+        st.subheader("Latest Data")
+        st.session_state.selected_accounts = st.multiselect("Select Accounts", account_options, default=account_options)
+        all_selected = set(st.session_state.selected_accounts) == set(account_options)
+        df = latest_balances(st.session_state.username, None if all_selected else st.session_state.selected_accounts)
+    if st.session_state.table == "All Data":
+        st.subheader("All Data")
+        st.session_state.selected_accounts = st.multiselect("Select Accounts", account_options, default=account_options)
+        page_size = st.selectbox("Rows per page", PAGE_SIZES, index=1)
+        page_base = (st.session_state.username, tuple(st.session_state.selected_accounts), page_size)
+        if st.session_state.get("page_base") != page_base:  # selection changed -> back to the first page
+            st.session_state.page_base = page_base
+            st.session_state.page_cursor = None
+            st.session_state.prefetched = {}
+        df, has_prev, has_next = get_page(page_base + (st.session_state.page_cursor,), st.session_state.prefetched)
+        first_key = last_key = None
+        st.session_state.prefetched = {}
+        if df.num_rows:  # a pyarrow Table, handed to st.dataframe as is
+            first_key, last_key = page_keys(df)
+            if has_next:  # fetch the likely next page while this one is on screen
+                next_request = page_base + (("after", last_key),)
+                st.session_state.prefetched = {next_request: prefetch_page(next_request)}
+        prev_col, count_col, next_col = st.columns([1, 2, 1])
+        prev_col.button("◀ Previous", disabled=not has_prev, on_click=set_page_cursor, args=(("before", first_key),), use_container_width=True)
+        count_col.caption(f"About {approx_row_count(st.session_state.username, st.session_state.selected_accounts):,} rows")
+        next_col.button("Next ▶", disabled=not has_next, on_click=set_page_cursor, args=(("after", last_key),), use_container_width=True)
+
+    if st.session_state.table == "Analytics":
+        st.subheader("Analytics")
+        group_by = st.pills("Group By", options=list(FILTER_DICT.keys()), default="Account Number")
+        df = portfolio_analytics(st.session_state.username, FILTER_DICT[group_by], group_by).summary
+        st.caption("Latest month. Growth and CAGR count each account's first balance as a contribution, not as growth.")
+
+    # temporary query
+    try:
+        with timer("stacksight_render_seconds", step="st.dataframe"):
+            st.dataframe(df, hide_index=True, use_container_width=True, column_config={
+                "Last Updated": st.column_config.DateColumn("Date", format="MMM YYYY"),
+                **{column: st.column_config.NumberColumn(format="percent") for column in PERCENT_COLUMNS}})
+    except NameError:
+        st.info("Please select a table to display data.")
+
+    # the download button of an earlier run is gone after any rerun, so its file can go too
+    remove_export(st.session_state.pop("export_path", None))
+    if st.session_state.table in ("Latest Data", "All Data"):
+        with st.expander("Export"):
+            export_format = st.radio("Format", list(EXPORT_FORMATS.keys()), horizontal=True)
+            if st.button("Prepare export"):
+                extension, mime = EXPORT_FORMATS[export_format]
+                try:
+                    path, result = export_to_file(st.session_state.username, st.session_state.selected_accounts, export_format)
+                except ExportFailed as e:
+                    st.error(f"Export failed: {e}")
+                else:
+                    st.session_state.export_path = path
+                    # read from disk only when the user clicks, not on every rerun
+                    st.download_button(f"Download {export_format}", data=partial(read_export, path),
+                                       file_name=f"stacksight_history.{extension}", mime=mime, on_click="ignore", type="primary")
+                    st.caption(f"{result['rows']:,} rows in {result['seconds']:.2f}s")